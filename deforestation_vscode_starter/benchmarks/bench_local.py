@@ -0,0 +1,110 @@
+"""Stage-level benchmark for src.local_pipeline.run on synthetic rasters.
+
+    python -m benchmarks.bench_local --sizes 1000 4000 --compress deflate --out bench.json
+
+Each case runs in a fresh process so peak RSS is per case. Stage timings are the
+pipeline's own instrumentation spans, for the in-memory run (sizes up to
+--max-in-memory) and the tiled run. For the tiled run `tile_stage_s` breaks the
+tile passes down into read / ndvi / threshold / closing / small_objects /
+patch_stats / write, summed over all tiles (so over all workers, too).
+"""
+from __future__ import annotations
+import argparse, json, os, platform, subprocess, sys, tempfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np, rasterio
+
+from benchmarks.synth import synth_pair
+from src import local_pipeline
+from src.instrument import StageTimer, Tracer, peak_rss_mb
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def _run(name: str, mpx: float, *args, **kwargs) -> Dict[str, Any]:
+    report = local_pipeline.run(*args, tracer=Tracer(), **kwargs)
+    inst = report["instrumentation"]
+    stages = [{**s, "mpx_per_s": round(mpx / s["wall_s"], 2) if s["wall_s"] > 0 else None}
+              for s in inst["stages"]]
+    # run_tiled attaches the seconds its tile workers spent per stage
+    tile_stages = StageTimer()
+    for s in inst["stages"]:
+        tile_stages.merge(s["attrs"].get("stage_s", {}))
+    return {"mode": name, "elapsed_s": inst["elapsed_s"], "stages": stages,
+            "tile_stage_s": tile_stages.rounded()}
+
+def _run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    # a spawned child defaults to spawn for its own pools; use what a normal run would get
+    mp.set_start_method(case["start_method"], force=True)
+    work = case["workdir"]
+    past = synth_pair(work, case["size"], case["dtype"], case["tiled"], case["compress"], period=0)
+    pres = synth_pair(work, case["size"], case["dtype"], case["tiled"], case["compress"], period=1)
+    os.chdir(work)
+    mpx = case["size"] ** 2 / 1e6
+    args = (*past, *pres, None, case["min_patch_pixels"], case["morph_radius"])
+    # the pipeline's own spans, so the numbers are exactly what run() does (COGs, patch CSV ...)
+    runs = []
+    if case["in_memory"]:
+        runs.append(_run("in_memory", mpx, *args))
+    runs.append(_run("tiled", mpx, *args, tile_size=case["tile_size"], workers=case["workers"]))
+
+    result = {k: v for k, v in case.items() if k != "workdir"}
+    result["megapixels"] = round(mpx, 3)
+    result["runs"] = runs
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def main(argv: List[str] | None = None):
+    p = argparse.ArgumentParser(description="Benchmark local_pipeline stages on synthetic rasters")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1000, 4000])
+    p.add_argument("--dtype", default="uint16")
+    p.add_argument("--untiled", action="store_true", help="write striped instead of 256px-tiled inputs")
+    p.add_argument("--compress", default=None, help="none, deflate, zstd, lzw ...")
+    p.add_argument("--tile-size", type=int, default=1024)
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--min-patch-pixels", type=int, default=25)
+    p.add_argument("--morph-radius", type=int, default=1)
+    p.add_argument("--max-in-memory", type=int, default=10000,
+                   help="largest size that also runs the in-memory path")
+    p.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "deforest_bench"))
+    p.add_argument("--out", default=None, help="write JSON results here (default: stdout)")
+    args = p.parse_args(argv)
+
+    compress = None if args.compress in (None, "none") else args.compress
+    workdir = os.path.abspath(args.workdir)
+    cases = [dict(size=s, dtype=args.dtype, tiled=not args.untiled, compress=compress,
+                  tile_size=args.tile_size, workers=args.workers, min_patch_pixels=args.min_patch_pixels,
+                  morph_radius=args.morph_radius, in_memory=s <= args.max_in_memory,
+                  start_method=mp.get_start_method(), workdir=workdir)
+             for s in args.sizes]
+    ctx = mp.get_context("spawn")
+    results = []
+    for case in cases:
+        # not a Pool: its workers are daemonic and could not start run()'s own process pool
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            res = pool.submit(_run_case, case).result()
+        for run in res["runs"]:
+            print(f"{res['size']}px {run['mode']}: "
+                  + ", ".join(f"{s['name']} {s['wall_s']:.2f}s" for s in run["stages"]), file=sys.stderr)
+            if run["tile_stage_s"]:
+                print("    per tile stage: " + ", ".join(f"{k} {v:.2f}s" for k, v in run["tile_stage_s"].items()),
+                      file=sys.stderr)
+        results.append(res)
+
+    doc = {"git_rev": _git_rev(), "python": platform.python_version(), "numpy": np.__version__,
+           "rasterio": rasterio.__version__, "machine": platform.machine(),
+           "cpu_count": os.cpu_count(), "cases": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(doc, f, indent=2)
+    else:
+        json.dump(doc, sys.stdout, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+from __future__ import annotations
+import os
+import numpy as np, rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from typing import Tuple
+
+SYNTH_VERSION = 2  # part of the file names, so cached scenes from older generators are not reused
+
+def synth_pair(out_dir: str, size: int, dtype: str = "uint16", tiled: bool = True,
+               compress: str | None = None, period: int = 0, block: int = 256,
+               seed: int = 0) -> Tuple[str, str]:
+    """Write a synthetic red/NIR GeoTIFF pair of size x size pixels (10 m UTM grid).
+
+    Vegetation is a smooth field of overlapping blobs plus noise, generated strip by
+    strip so 40k px scenes never need the whole array in memory. `period` shifts
+    the same field sideways (with fresh noise), so past/present pairs differ the way
+    a slowly changing landscape does.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tag = f"{size}_{dtype}_{'tiled' if tiled else 'strip'}_{compress or 'raw'}_t{period}_v{SYNTH_VERSION}"
+    red_path = os.path.join(out_dir, f"red_{tag}.tif"); nir_path = os.path.join(out_dir, f"nir_{tag}.tif")
+    if os.path.exists(red_path) and os.path.exists(nir_path):
+        return red_path, nir_path
+    profile = dict(driver="GTiff", height=size, width=size, count=1, dtype=dtype,
+                   crs="EPSG:32644", transform=from_origin(500000, 3000000, 10, 10))
+    if tiled:
+        profile.update(tiled=True, blockxsize=block, blockysize=block)
+    if compress:
+        profile.update(compress=compress)
+    # the field depends on `seed` only; `period` shifts it by 1/64 of the scene and redraws the noise
+    field = np.random.default_rng(seed); noise = np.random.default_rng([seed, period])
+    scale = np.iinfo(dtype).max / 10000 if np.dtype(dtype).kind in "ui" else 1 / 10000
+    fx = 2 * np.pi * field.uniform(2, 6, 3) / size; fy = 2 * np.pi * field.uniform(2, 6, 3) / size
+    x = np.arange(size) + period * size / 64
+    with rasterio.open(red_path, "w", **profile) as red_ds, rasterio.open(nir_path, "w", **profile) as nir_ds:
+        for row in range(0, size, block):
+            h = min(block, size - row)
+            y = np.arange(row, row + h)[:, None]
+            veg = sum(np.sin(fx[i] * x[None, :] + i) * np.cos(fy[i] * y + 2 * i) for i in range(3)) / 3
+            veg = (veg + 1) / 2 + noise.normal(0, 0.05, (h, size))
+            nir = 2000 + 3000 * veg; red = 2500 - 1500 * veg
+            win = Window(0, row, size, h)
+            red_ds.write(np.clip(red * scale, 0, None).astype(dtype), 1, window=win)
+            nir_ds.write(np.clip(nir * scale, 0, None).astype(dtype), 1, window=win)
+    return red_path, nir_path
@@ -1,8 +1,8 @@
 import streamlit as st
-import os, sys, tempfile, time, asyncio
+import os, sys, asyncio, threading, time, json, hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-import numpy as np, rasterio, folium, matplotlib.pyplot as plt
-from PIL import Image
+import numpy as np, folium, matplotlib.pyplot as plt
 
 # --- Patch async loop for tileserver ---
 try: asyncio.get_event_loop()
@@ -11,6 +11,12 @@ except RuntimeError: asyncio.set_event_loop(asyncio.new_event_loop())
 # --- Imports ---
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 import gee_pipeline
+from cache import ResultCache
+from instrument import Tracer
+from histogram import NDVIHistogram
+from render import render_png
+from tileserver import LOOPBACK_HOSTS, get_server
+from urllib.parse import urlsplit
 import geemap.foliumap as geemap_folium
 
 # Optional leafmap swipe support
@@ -22,30 +28,37 @@ except Exception:
 
 # --- Helper functions ---
 def safe_makedirs(p): os.makedirs(p, exist_ok=True)
-def save_temp_file(f,suffix):
-    tmp = tempfile.NamedTemporaryFile(delete=False,suffix=suffix)
-    tmp.write(f.read()); tmp.flush(); tmp.close(); return tmp.name
-def write_png_thumb(tiff,out):
-    with rasterio.open(tiff) as src:
-        band = src.read(1).astype(float)
-        band = np.nan_to_num(band)
-        mn,mx = np.nanmin(band), np.nanmax(band)
-        arr = (band-mn)/(mx-mn+1e-9)
-        rgb = (plt.get_cmap("RdYlGn")(arr)[:,:,:3]*255).astype(np.uint8)
-        Image.fromarray(rgb).save(out)
+PALETTE=["red","yellow","green"]
+@st.cache_data(show_spinner=False)
+def _tile_url(tiff,mtime): return get_server().register(tiff,palette=PALETTE)
+def tile_url(tiff): return _tile_url(tiff,os.path.getmtime(tiff))
+@st.cache_data(show_spinner=False,ttl=60)
+def _tiles_reachable(): return get_server().reachable()
+def _browser_is_local():
+    # st.context (Streamlit >= 1.37) has the Host the browser used; assume local when unknown
+    try: host=st.context.headers.get("Host") or ""
+    except Exception: return True
+    return not host or urlsplit("//"+host).hostname in LOOPBACK_HOSTS
+def tiles_usable():
+    # loopback tile urls only work for a browser on this machine (set TILE_HOST / TILE_PUBLIC_URL to share)
+    return (not get_server().local_only or _browser_is_local()) and _tiles_reachable()
+@st.cache_data(show_spinner=False)
+def mask_histogram(tiff,mtime,bins=40):
+    # exact counts streamed block by block (nodata skipped); the same histogram gives the stats
+    h=NDVIHistogram.from_raster(tiff,bins=bins,lo=0.0,hi=1.0)
+    return h.counts,h.lo+np.arange(bins+1)*h.bin_width,h.stats()
 def add_raster(m,tiff,name):
-    try:
-        m.add_raster(tiff,palette=["red","yellow","green"],layer_name=name,opacity=0.8)
-    except Exception:
-        with rasterio.open(tiff) as src:
-            arr = src.read(1)
-            arr = np.nan_to_num(arr)
-            arr = (arr-arr.min())/(arr.max()-arr.min()+1e-9)
-            rgb = (plt.get_cmap("RdYlGn")(arr)[:,:,:3]*255).astype(np.uint8)
-            png=tempfile.NamedTemporaryFile(delete=False,suffix=".png").name
-            Image.fromarray(rgb).save(png)
-            bounds=[[src.bounds.bottom,src.bounds.left],[src.bounds.top,src.bounds.right]]
-            folium.raster_layers.ImageOverlay(image=png,bounds=bounds,name=name,opacity=0.85).add_to(m)
+    if tiles_usable():
+        try:
+            # XYZ tiles rendered on demand from the COG, cached in memory and by the browser
+            folium.raster_layers.TileLayer(tiles=tile_url(tiff),attr="local tiles",name=name,overlay=True,opacity=0.8).add_to(m)
+            return
+        except Exception:
+            pass
+    # downsampled, cached PNG overlay: cost does not grow with scene size
+    png,b=render_png(tiff,palette=PALETTE)
+    bounds=[[b.bottom,b.left],[b.top,b.right]]
+    folium.raster_layers.ImageOverlay(image=png,bounds=bounds,name=name,opacity=0.85).add_to(m)
 
 # --- Page style ---
 st.set_page_config(page_title="🌳 Drone-AI Neo-Forest Console",layout="wide",page_icon="🛰️")
@@ -78,17 +91,62 @@ with col2:
 
 st.divider()
 
+# --- Background jobs (shared by every session on this server) ---
+STEPS={"init_ee":"Initializing Earth Engine...","load_aoi":"Loading AOI...","fetch_stats":"Computing NDVI composites and forest areas...",
+       "export_change":"Exporting change map...","split_masks":"Splitting past/present masks..."}
+@st.cache_resource
+def job_pool(): return ThreadPoolExecutor(max_workers=4)
+@st.cache_resource
+def job_registry(): return {},threading.Lock()
+@st.cache_resource
+def result_cache(): return ResultCache()
+
+def submit_job(key,aoi_bytes,t0,t1,ndvi_thresh,cloud_prob):
+    """One pipeline run per (AOI hash, parameters); identical requests share it, failed ones rerun."""
+    jobs,lock=job_registry()
+    with lock:
+        job=jobs.get(key)
+        if job is None or (job["future"].done() and job["future"].exception()):
+            out_dir=os.path.join("outputs","runs",key[:16]); safe_makedirs(out_dir)
+            aoi=os.path.join(out_dir,"aoi.geojson")
+            with open(aoi,"wb") as f: f.write(aoi_bytes)
+            state={"step":None,"done":[]}
+            def on_event(event,span):
+                # worker thread: only touch plain state, the page polls it
+                if event=="start": state["step"]=span.name
+                else: state["done"].append(span.name)
+            future=job_pool().submit(gee_pipeline.run,aoi,t0,t1,ndvi_thresh,cloud_prob,tracer=Tracer(on_event=on_event),
+                                     cache=result_cache(),out_dir=out_dir)
+            job=jobs[key]={"future":future,"state":state,"out_dir":out_dir}
+    return job
+
 # --- Run pipeline ---
 if run_btn:
     if not aoi_file: st.warning("Upload AOI first."); st.stop()
-    tmp_aoi=save_temp_file(aoi_file,".geojson")
+    t0,t1=[str(start_past),str(end_past)],[str(start_present),str(end_present)]
+    aoi_bytes=aoi_file.getvalue()
+    key=hashlib.sha256(aoi_bytes+json.dumps([t0,t1,ndvi_thresh,cloud_prob]).encode()).hexdigest()
+    submit_job(key,aoi_bytes,t0,t1,ndvi_thresh,cloud_prob)
+    st.session_state["job_key"]=key
     st.success("✅ AOI loaded.")
 
-    progress=st.progress(0);status=st.empty()
-    steps=["Initializing Earth Engine...","Fetching Sentinel-2...","Computing NDVI...","Generating Masks...","Comparing Areas...","Preparing Report..."]
-    for i,s in enumerate(steps): status.info(s); progress.progress((i+1)/len(steps)); time.sleep(0.4)
+job=job_registry()[0].get(st.session_state.get("job_key"))
+result=None
+if job is not None:
+    future,state=job["future"],job["state"]
+    if not future.done():
+        # widgets stay live: any rerun reattaches to the running job
+        st.progress(min(len(state["done"])/len(STEPS),1.0)); st.info(STEPS.get(state["step"],"Starting..."))
+        time.sleep(0.5); st.rerun()
+    elif future.exception():
+        st.error(f"❌ Analysis failed: {future.exception()}")
+    else:
+        result=future.result()
 
-    result=gee_pipeline.run(tmp_aoi,[str(start_past),str(end_past)],[str(start_present),str(end_present)],ndvi_thresh,cloud_prob)
+if result is not None:
+    out_dir=job["out_dir"]
+    st.success(f"Finished in {result['instrumentation']['elapsed_s']:.1f}s ({result['instrumentation']['getinfo_calls']} Earth Engine round-trips)")
+    if result.get("export_error"): st.warning(f"⚠️ Change map not exported, maps below are missing: {result['export_error']}")
 
     st.markdown("### 📊 Forest Change Summary")
     c1,c2,c3=st.columns(3)
@@ -117,19 +175,20 @@ if run_btn:
 
     # --- Swipe visualization ---
     st.markdown("### 🛰️ NDVI Swipe Comparison (Past vs Present)")
-    past_tif=os.path.join("outputs","forest_mask_past.tif")
-    pres_tif=os.path.join("outputs","forest_mask_present.tif")
+    past_tif=os.path.join(out_dir,"forest_mask_past.tif")
+    pres_tif=os.path.join(out_dir,"forest_mask_present.tif")
 
-    if HAS_LEAFMAP:
+    if HAS_LEAFMAP and tiles_usable():
         try:
             m=leafmap.Map(center=[26.85,80.95],zoom=9)
             if hasattr(leafmap,"set_default_center"): leafmap.set_default_center(26.85,80.95)
-            m.split_map(left_layer=past_tif,right_layer=pres_tif,left_label="Past NDVI",right_label="Present NDVI")
+            m.split_map(left_layer=tile_url(past_tif),right_layer=tile_url(pres_tif),left_label="Past NDVI",right_label="Present NDVI")
             m.to_streamlit(width=1000,height=600)
         except Exception as e:
             st.warning(f"⚠️ Swipe map unavailable: {e}")
     else:
-        st.warning("⚠️ Swipe map requires `leafmap`. Showing static fallback.")
+        if not HAS_LEAFMAP: st.warning("⚠️ Swipe map requires `leafmap`. Showing static fallback.")
+        else: st.info("ℹ️ Tile server not reachable from this browser (see TILE_HOST / TILE_PUBLIC_URL). Showing static maps.")
         m=geemap_folium.Map(center=[26.85,80.95],zoom=9)
         if os.path.exists(past_tif): add_raster(m,past_tif,"Past NDVI")
         if os.path.exists(pres_tif): add_raster(m,pres_tif,"Present NDVI")
@@ -138,13 +197,13 @@ if run_btn:
     # --- NDVI histogram ---
     st.markdown("### 📈 NDVI Distribution")
     try:
-        with rasterio.open(past_tif) as src: past=src.read(1).ravel()
-        with rasterio.open(pres_tif) as src: pres=src.read(1).ravel()
-        plt.figure(figsize=(6,3))
-        plt.hist(past,bins=40,alpha=0.5,label="Past",color="red")
-        plt.hist(pres,bins=40,alpha=0.5,label="Present",color="green")
+        plt.figure(figsize=(6,3)); means=[]
+        for tif,label,color in ((past_tif,"Past","red"),(pres_tif,"Present","green")):
+            counts,edges,stats=mask_histogram(tif,os.path.getmtime(tif))
+            plt.hist(edges[:-1],bins=edges,weights=counts,alpha=0.5,label=label,color=color)
+            means.append(f"{label}: mean {stats['mean']:.3f} over {stats['count']:,} px")
         plt.legend(); plt.xlabel("NDVI"); plt.ylabel("Pixel Count")
-        st.pyplot(plt.gcf())
+        st.pyplot(plt.gcf()); st.caption(" · ".join(means))
     except Exception as e:
         st.info(f"Histogram unavailable: {e}")
 
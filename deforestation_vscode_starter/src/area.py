@@ -0,0 +1,44 @@
+from __future__ import annotations
+import math
+import numpy as np
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+ROW_CHUNK = 256  # rows per bincount in `class_areas`
+
+def _authalic_q(lat: np.ndarray) -> np.ndarray:
+    e = math.sqrt(WGS84_F * (2 - WGS84_F))
+    s = np.sin(lat)
+    return s / (1 - e * e * s * s) + np.log((1 + e * s) / (1 - e * s)) / (2 * e)
+
+def row_areas(crs, transform, height: int) -> np.ndarray:
+    """Pixel area (m²) of each of the `height` rows of a north-up grid.
+
+    Projected grids get their constant cell area. On geographic grids a cell's area
+    depends only on its latitude, so one geodesic (ellipsoidal) value per row gives
+    exact hectares at O(height) memory instead of a full per-pixel area grid.
+    """
+    t = transform
+    if crs is None or not crs.is_geographic:
+        # pixel area from transform (assumes meters; ensure projected CRS)
+        return np.full(height, abs(t.a * t.e))
+    edges = np.radians(np.clip(t.f + t.e * np.arange(height + 1), -90.0, 90.0))
+    b = WGS84_A * (1 - WGS84_F)
+    return np.abs(np.diff(_authalic_q(edges))) * b * b * math.radians(abs(t.a)) / 2
+
+def class_areas(code: np.ndarray, row_area: np.ndarray, nclass: int = 4) -> np.ndarray:
+    """Area (m²) per value 0..nclass-1 of the 2-D `code`, each pixel weighted by its row's area.
+
+    Per-row class counts come from one bincount per ROW_CHUNK rows (the same single
+    pass as an unweighted count) and are reduced against `row_area` as a 1-D dot product.
+    """
+    if np.all(row_area == row_area[0]):
+        return np.bincount(code.ravel(), minlength=nclass)[:nclass] * float(row_area[0])
+    out = np.zeros(nclass)
+    offsets = np.arange(ROW_CHUNK, dtype=np.intp)[:, None] * nclass
+    for r in range(0, code.shape[0], ROW_CHUNK):
+        block = code[r:r + ROW_CHUNK]; n = block.shape[0]
+        per_row = np.bincount((block + offsets[:n]).ravel(), minlength=n * nclass).reshape(n, nclass)
+        out += row_area[r:r + n] @ per_row
+    return out
@@ -0,0 +1,136 @@
+from __future__ import annotations
+import csv, json, os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+from . import gee_pipeline
+from .cache import cache_key
+from .instrument import Tracer
+from .utils import iter_features, percent_from_areas, report_row
+
+SUMMARY_FIELDS = ["region", "t0_start", "t0_end", "t1_start", "t1_end",
+                  "forest_area_past_ha", "forest_area_present_ha", "forest_loss_ha", "forest_gain_ha",
+                  "net_change_ha", "change_percent", "change_type",
+                  "ndvi_threshold_used", "data_source_past", "data_source_present"]
+def _summary_row(report: Dict[str, Any]) -> Dict[str, Any]:
+    row = {k: report.get(k) for k in SUMMARY_FIELDS}
+    row.update(t0_start=report["past_window"][0], t0_end=report["past_window"][1],
+               t1_start=report["present_window"][0], t1_end=report["present_window"][1])
+    return row
+
+def _load_progress(path: str, keys: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """Rows of finished features whose record carries the feature's current run key.
+
+    Records from a run with other windows / threshold / cloud_prob / geometry, and
+    features no longer in the AOI file, are ignored (and so dropped from summary.csv).
+    """
+    done = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line from a crash
+                if rec.get("status") == "done" and rec.get("key") == keys.get(rec["id"]):
+                    done[rec["id"]] = rec["row"]
+    return done
+
+def write_summary(rows: List[Dict[str, Any]], out_dir: str):
+    path = os.path.join(out_dir, "summary.csv")
+    with open(path + ".part", "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        w.writeheader(); w.writerows(rows)
+    os.replace(path + ".part", path)
+
+def run_batch(aoi_path: str, t0, t1, ndvi_thresh: float, cloud_prob: int, out_dir: str = "outputs/batch",
+              workers: int = 4, cache=None, client=None, trace_path: str | None = None) -> List[Dict[str, Any]]:
+    """Run every AOI feature through one Earth Engine session on a thread pool.
+
+    Per-feature outputs go to <out_dir>/<feature_id>/; finished features are appended to
+    <out_dir>/progress.jsonl with a hash of the run parameters and their geometry, so a
+    restarted batch skips them only if nothing changed. summary.csv is rewritten after
+    every feature and always covers the current features finished so far.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    progress_path = os.path.join(out_dir, "progress.jsonl")
+    features = list(iter_features(aoi_path))
+    keys = {fid: cache_key("batch", list(t0), list(t1), ndvi_thresh, cloud_prob, geom) for fid, geom in features}
+    done = _load_progress(progress_path, keys)
+    todo = [(fid, geom) for fid, geom in features if fid not in done]
+    print(f"🗺️ {len(features)} AOIs, {len(done)} already done, {len(todo)} to run.")
+    order = {fid: i for i, (fid, _) in enumerate(features)}
+
+    client = client or gee_pipeline.EEClient()
+    if todo:
+        client.initialize()
+
+    def one(fid, geom):
+        tracer = Tracer(trace_path=trace_path)
+        report = gee_pipeline.run(None, t0, t1, ndvi_thresh, cloud_prob, tracer=tracer, client=client,
+                                  cache=cache, geometry=geom, out_dir=os.path.join(out_dir, fid),
+                                  region_name=fid)
+        if report["export_error"]:
+            # stats are cached by now; failing here makes a resumed batch retry the map
+            raise RuntimeError(report["export_error"])
+        return _summary_row(report)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        jobs = {pool.submit(one, fid, geom): fid for fid, geom in todo}
+        for job in as_completed(jobs):
+            fid = jobs[job]
+            try:
+                row = job.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {fid} failed: {e}")
+                rec = {"id": fid, "key": keys[fid], "status": "failed", "error": str(e)}
+            else:
+                done[fid] = row
+                rec = {"id": fid, "key": keys[fid], "status": "done", "row": row}
+            with open(progress_path, "a") as f:
+                f.write(json.dumps(rec) + "\n")
+            write_summary(sorted(done.values(), key=lambda r: order.get(r["region"], len(order))), out_dir)
+
+    rows = sorted(done.values(), key=lambda r: order.get(r["region"], len(order)))
+    write_summary(rows, out_dir)
+    print(f"✅ Batch finished: {len(rows)} done, {failed} failed → {os.path.join(out_dir, 'summary.csv')}")
+    return rows
+
+def run_batch_grouped(aoi_path: str, t0, t1, ndvi_thresh: float, cloud_prob: int,
+                      out_dir: str = "outputs/batch", client=None, trace_path: str | None = None
+                      ) -> List[Dict[str, Any]]:
+    """Stats-only batch: every feature's past/present/loss hectares from a single reduceRegions
+    request (no per-feature mask exports), written as utils.save_report-style summary.csv rows."""
+    os.makedirs(out_dir, exist_ok=True)
+    features = list(iter_features(aoi_path))
+    print(f"🗺️ {len(features)} AOIs in one grouped Earth Engine request.")
+    areas, meta = gee_pipeline.run_many(features, t0, t1, ndvi_thresh, cloud_prob,
+                                        tracer=Tracer(trace_path=trace_path), client=client)
+    order = {fid: i for i, (fid, _) in enumerate(features)}
+    rows = []
+    for a in sorted(areas, key=lambda a: order.get(a["fid"], len(order))):
+        remaining, loss = percent_from_areas(a["forest_area_past_ha"], a["forest_area_present_ha"])
+        report = {
+            "region": a["fid"],
+            "past_window": list(t0),
+            "present_window": list(t1),
+            "total_area_ha": round(a["total_area_ha"], 2),
+            "forest_area_past_ha": round(a["forest_area_past_ha"], 2),
+            "forest_area_present_ha": round(a["forest_area_present_ha"], 2),
+            "remaining_percent": round(remaining, 2),
+            "deforestation_percent": round(loss, 2),
+            "ndvi_threshold_used": ndvi_thresh,
+        }
+        rows.append({**report_row(report), "forest_loss_ha": round(a["forest_loss_ha"], 2),
+                     "forest_gain_ha": round(a["forest_gain_ha"], 2),
+                     "net_change_ha": round(a["forest_gain_ha"] - a["forest_loss_ha"], 2),
+                     "data_source_past": meta["past"]["source"],
+                     "data_source_present": meta["present"]["source"]})
+    path = os.path.join(out_dir, "summary.csv")
+    with open(path, "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["region"])
+        w.writeheader(); w.writerows(rows)
+    print(f"✅ Grouped batch finished: {len(rows)} AOIs → {path}")
+    return rows
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import hashlib, json, os, shutil, tempfile, threading
+from typing import Any, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "deforestation")
+DEFAULT_MAX_MB = 2048
+# bump when the computation behind cached values changes
+CACHE_VERSION = 1
+
+def cache_key(*parts: Any) -> str:
+    """Content hash of JSON-able parts (dict key order does not matter)."""
+    blob = json.dumps([CACHE_VERSION, *parts], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """On-disk content-addressed cache for JSON results and exported files.
+
+    Entries live under `<cache_dir>/<key[:2]>/<key><ext>`; a hit refreshes the entry's
+    mtime and the oldest entries are evicted once the cache grows past `max_mb`.
+    Safe to share between threads; an entry evicted under a reader (by this or
+    another process) is a miss.
+    """
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_mb: float = DEFAULT_MAX_MB):
+        self.cache_dir = cache_dir; self.max_bytes = int(max_mb * 1024 * 1024)
+        self._evict_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def _hit(self, path: str) -> bool:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _store(self, path: str, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def get_json(self, key: str) -> Optional[Any]:
+        path = self._path(key, ".json")
+        if not self._hit(path):
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put_json(self, key: str, value: Any):
+        def write(tmp):
+            with open(tmp, "w") as f:
+                json.dump(value, f)
+        self._store(self._path(key, ".json"), write)
+
+    def get_file(self, key: str, dest: str) -> bool:
+        """Copy a cached file to `dest`; False on a miss."""
+        path = self._path(key, os.path.splitext(dest)[1])
+        if not self._hit(path):
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        try:
+            shutil.copyfile(path, dest)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put_file(self, key: str, src: str):
+        if os.path.exists(src):
+            self._store(self._path(key, os.path.splitext(src)[1]), lambda tmp: shutil.copyfile(src, tmp))
+
+    def evict(self):
+        # one evictor per cache object; files removed meanwhile by another evictor are skipped
+        with self._evict_lock:
+            entries = []
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".part"):
+                        continue
+                    p = os.path.join(root, name)
+                    try:
+                        st = os.stat(p)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, p))
+            total = sum(e[1] for e in entries)
+            for _, size, p in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+                total -= size
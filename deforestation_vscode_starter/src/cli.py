@@ -1,6 +1,8 @@
 from __future__ import annotations
-import argparse, yaml, sys
-from . import gee_pipeline, local_pipeline
+import argparse, os, yaml, sys
+from . import batch, gee_pipeline, local_pipeline, monitor, vectorize, zonal
+from .cache import ResultCache, DEFAULT_CACHE_DIR
+from .instrument import Tracer
 
 def main():
     p = argparse.ArgumentParser(description="Deforestation % tool (GEE or Local)")
@@ -9,7 +11,39 @@ def main():
     # local mode args:
     p.add_argument("--red-past"); p.add_argument("--nir-past")
     p.add_argument("--red-present"); p.add_argument("--nir-present")
+    p.add_argument("--past", help="multi-band past stack (instead of --red-past/--nir-past)")
+    p.add_argument("--present", help="multi-band present stack (instead of --red-present/--nir-present)")
+    p.add_argument("--red-band", type=int, default=1, help="red band index in the local inputs")
+    p.add_argument("--nir-band", type=int, default=1, help="NIR band index in the local inputs")
+    p.add_argument("--tile-size", type=int, default=None,
+                   help="stream local rasters in tiles of about this many pixels per side")
+    p.add_argument("--zones", default=None,
+                   help="local: polygon GeoJSON (wards, compartments, parcels) for per-zone stats in zonal_summary.csv")
+    p.add_argument("--vectorize", default=None, metavar="PATH",
+                   help="write loss patches as polygons to PATH (.gpkg or .geojson) after a single-AOI run")
+    p.add_argument("--workers", type=int, default=1,
+                   help="local: process tiles on N cores (implies tiled mode); batch: AOIs run concurrently")
+    # batch (GEE) args:
+    p.add_argument("--batch", default=None,
+                   help="multi-feature GeoJSON or directory of GeoJSONs to run feature by feature")
+    p.add_argument("--out-dir", default="outputs/batch", help="batch output directory (resumable)")
+    p.add_argument("--grouped", action="store_true",
+                   help="batch: areas only, all AOIs in one reduceRegions request (no mask exports)")
+    p.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="GEE result cache location")
+    p.add_argument("--no-cache", action="store_true", help="always recompute GEE results")
+    p.add_argument("--trace", default=None, help="append per-stage timings to this JSONL file")
+    # time-series monitoring args:
+    p.add_argument("--monitor", default=None, metavar="PERIOD",
+                   help="add PERIOD (e.g. 2024-03) to the AOI's monitoring store, diffed against the last period only; "
+                        "gee: PERIOD is the date window (YYYY, YYYY-MM or START/END)")
+    p.add_argument("--state-dir", default="outputs/monitor", help="monitoring store location")
+    p.add_argument("--aoi-id", default=None, help="monitoring store key (default: AOI file name)")
     args = p.parse_args()
+    if (args.past or args.present) and args.red_band == args.nir_band:
+        p.error("--past/--present stacks need distinct --red-band and --nir-band (e.g. --red-band 3 --nir-band 4)")
+    args.red_past = args.red_past or args.past; args.nir_past = args.nir_past or args.past
+    args.red_present = args.red_present or args.present; args.nir_present = args.nir_present or args.present
+    tracer = Tracer(trace_path=args.trace)
 
     with open(args.config, "r") as f:
         cfg = yaml.safe_load(f)
@@ -20,16 +54,61 @@ def main():
         t1 = (cfg["present"]["start"], cfg["present"]["end"])
         ndvi_thresh = float(cfg.get("ndvi_threshold", 0.4))
         cloud_prob = int(cfg.get("cloud_prob_threshold", 40))
-        gee_pipeline.run(aoi, t0, t1, ndvi_thresh, cloud_prob)
+        cache = None if args.no_cache else ResultCache(args.cache_dir)
+        if args.monitor:
+            # validate the period before any Earth Engine work or state is written
+            try:
+                window = monitor.period_window(args.monitor)
+            except ValueError as e:
+                p.error(str(e))
+            store = monitor.MonitorStore(args.state_dir, args.aoi_id or os.path.splitext(os.path.basename(aoi))[0])
+            geometry = gee_pipeline.load_aoi_geometry(aoi)
+            client = gee_pipeline.EEClient()
+            if store.last is None:
+                # first run: the config's past window is the baseline
+                monitor.step_gee(store, t0[0], t0, geometry, ndvi_thresh, cloud_prob, tracer, client)
+            monitor.step_gee(store, args.monitor, window, geometry, ndvi_thresh, cloud_prob, tracer, client)
+        elif args.batch and args.grouped:
+            batch.run_batch_grouped(args.batch, t0, t1, ndvi_thresh, cloud_prob, out_dir=args.out_dir,
+                                    trace_path=args.trace)
+        elif args.batch:
+            batch.run_batch(args.batch, t0, t1, ndvi_thresh, cloud_prob, out_dir=args.out_dir,
+                            workers=args.workers, cache=cache, trace_path=args.trace)
+        else:
+            gee_pipeline.run(aoi, t0, t1, ndvi_thresh, cloud_prob, tracer=tracer, cache=cache)
+            change_map = os.path.join("outputs", "change_map.tif")
+            if args.vectorize and os.path.exists(change_map):
+                vectorize.vectorize_loss(change_map, args.vectorize, int(cfg.get("min_patch_pixels", 25)),
+                                         tracer=tracer)
+    elif args.monitor:
+        if not (args.red_present and args.nir_present):
+            print("Monitoring needs --present or --red-present --nir-present (and past inputs on the first run)",
+                  file=sys.stderr)
+            sys.exit(2)
+        ndvi_thresh = cfg.get("ndvi_threshold", None)
+        minpix = int(cfg.get("min_patch_pixels", 25))
+        morph = int(cfg.get("morph_radius", 1))
+        store = monitor.MonitorStore(args.state_dir, args.aoi_id or "AOI")
+        if store.last is None and args.red_past and args.nir_past:
+            monitor.step_local(store, "baseline", args.red_past, args.nir_past, ndvi_thresh, minpix, morph, tracer,
+                               args.red_band, args.nir_band)
+        monitor.step_local(store, args.monitor, args.red_present, args.nir_present, ndvi_thresh, minpix, morph, tracer,
+                           args.red_band, args.nir_band)
     else:
         if not all([args.red_past, args.nir_past, args.red_present, args.nir_present]):
-            print("Local mode requires --red-past --nir-past --red-present --nir-present", file=sys.stderr)
+            print("Local mode requires --past --present (multi-band) or --red-past --nir-past --red-present --nir-present",
+                  file=sys.stderr)
             sys.exit(2)
         ndvi_thresh = cfg.get("ndvi_threshold", None)
         minpix = int(cfg.get("min_patch_pixels", 25))
         morph = int(cfg.get("morph_radius", 1))
         local_pipeline.run(args.red_past, args.nir_past, args.red_present, args.nir_present,
-                           ndvi_thresh, minpix, morph)
+                           ndvi_thresh, minpix, morph, tile_size=args.tile_size,
+                           workers=args.workers, tracer=tracer, red_band=args.red_band, nir_band=args.nir_band)
+        if args.zones:
+            zonal.run_zonal(args.zones, tracer=tracer)
+        if args.vectorize:
+            vectorize.vectorize_loss(os.path.join("outputs", "change_map.tif"), args.vectorize, minpix, tracer=tracer)
 
 if __name__ == "__main__":
     main()
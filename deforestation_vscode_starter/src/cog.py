@@ -0,0 +1,65 @@
+from __future__ import annotations
+import os
+from functools import lru_cache
+from typing import Any, Dict, List
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.shutil import copy as rio_copy
+
+COG_BLOCK = 512
+COG_COMPRESS = "DEFLATE"
+OVERVIEW_MIN_PX = 256  # stop adding overview levels below this size
+COG_THREADS = "ALL_CPUS"  # GDAL worker threads for compression and overviews
+MASK_NODATA = 255  # outside-AOI pixels of masks that carry a nodata value
+
+@lru_cache(maxsize=None)
+def has_cog_driver() -> bool:
+    with rasterio.Env() as env:
+        return "COG" in env.drivers()
+
+def mask_profile(profile: Dict[str, Any], nbits: int | None = None,
+                 nodata: int | None = None) -> Dict[str, Any]:
+    """Profile for writing a uint8 mask on `profile`'s grid before `to_cog`.
+
+    Tiled and lightly compressed, so windowed writes stay cheap; `nbits` packs
+    0/1 masks (1) or change codes (2) into sub-byte samples. Masks with a `nodata`
+    value (e.g. MASK_NODATA) need the full byte.
+    """
+    out = {k: profile[k] for k in ("width", "height", "crs", "transform") if k in profile}
+    out.update(driver="GTiff", count=1, dtype="uint8", nodata=nodata, tiled=True,
+               blockxsize=COG_BLOCK, blockysize=COG_BLOCK, compress=COG_COMPRESS, zlevel=1,
+               bigtiff="IF_SAFER")
+    if nbits:
+        out["nbits"] = nbits
+    return out
+
+def overview_factors(height: int, width: int, min_px: int = OVERVIEW_MIN_PX) -> List[int]:
+    factors, f = [], 2
+    while max(height, width) // f >= min_px:
+        factors.append(f); f *= 2
+    return factors
+
+def to_cog(path: str, nbits: int | None = None, resampling: str = "nearest"):
+    """Rewrite the GeoTIFF at `path` in place as a Cloud-Optimized GeoTIFF.
+
+    Tiled, DEFLATE-compressed, with internal overviews, so viewers can read just
+    the level they display. GDAL compresses on all cores (COG_THREADS) and releases
+    the GIL, so several files can be converted from threads at once. Without GDAL's
+    COG driver (GDAL < 3.1) overviews are added to the existing tiled file instead.
+    """
+    if not has_cog_driver():
+        with rasterio.Env(GDAL_NUM_THREADS=COG_THREADS), rasterio.open(path, "r+") as ds:
+            ds.build_overviews(overview_factors(ds.height, ds.width), Resampling[resampling])
+            ds.update_tags(ns="rio_overview", resampling=resampling)
+        return
+    opts = dict(driver="COG", compress=COG_COMPRESS, blocksize=COG_BLOCK,
+                overview_resampling=resampling.upper(), bigtiff="IF_SAFER", num_threads=COG_THREADS)
+    if nbits:
+        opts["nbits"] = nbits
+    tmp = path + ".part"
+    try:
+        rio_copy(path, tmp, **opts)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -0,0 +1,105 @@
+"""Grid-split downloads of rasters too large for one request, mosaicked on disk.
+
+    grid = export_grid(bounds, res)
+    download_mosaic(url_for, "outputs/change_map.tif", *grid, crs="EPSG:4326")
+
+`url_for(window, transform)` returns the download URL of one sub-image; tiles are
+fetched concurrently by `workers` threads and written into a tiled GeoTIFF as they
+arrive, so memory holds at most a few tiles. The network layer is `HTTPTransport`;
+swap in any object with `get(url) -> bytes` (or point `url_for` at a local server)
+to test without Earth Engine.
+"""
+from __future__ import annotations
+import contextvars, io, math, os, urllib.request, zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Tuple
+import rasterio
+from affine import Affine
+from rasterio.io import MemoryFile
+from rasterio.windows import Window, transform as window_transform
+
+# Works both as `src.download` and as a top-level module (Streamlit app)
+try:
+    from .cog import COG_BLOCK, COG_COMPRESS
+    from .tiling import iter_tiles
+except ImportError:
+    from cog import COG_BLOCK, COG_COMPRESS
+    from tiling import iter_tiles
+
+EXPORT_TILE_PX = 2048  # sub-request side; 2048² float32 stays under the 32 MB download cap
+EXPORT_WORKERS = 4
+EXPORT_TIMEOUT_S = 300
+DEG_PER_M = 1 / 111319.49079327357  # Earth Engine's metres -> degrees at the equator
+
+class HTTPTransport:
+    """The network layer: one GET per sub-image, raising on HTTP errors."""
+    def __init__(self, timeout: float = EXPORT_TIMEOUT_S):
+        self.timeout = timeout
+
+    def get(self, url: str) -> bytes:
+        with urllib.request.urlopen(url, timeout=self.timeout) as resp:
+            return resp.read()
+
+def export_grid(bounds: Tuple[float, float, float, float], res: float) -> Tuple[Affine, int, int]:
+    """(transform, width, height) of a north-up grid covering `bounds`, snapped to multiples
+    of `res` so repeated exports of overlapping regions line up pixel for pixel."""
+    west, south, east, north = bounds
+    left = math.floor(west / res) * res; top = math.ceil(north / res) * res
+    width = max(math.ceil((east - left) / res), 1); height = max(math.ceil((top - south) / res), 1)
+    return Affine(res, 0, left, 0, -res, top), width, height
+
+def _geotiff(data: bytes) -> bytes:
+    # Earth Engine zips downloads unless format=GEO_TIFF was honoured
+    if data[:2] != b"PK":
+        return data
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        name = next(n for n in zf.namelist() if n.lower().endswith((".tif", ".tiff")))
+        return zf.read(name)
+
+def _mosaic_profile(src, transform: Affine, width: int, height: int, crs) -> dict:
+    return dict(driver="GTiff", width=width, height=height, count=src.count, dtype=src.dtypes[0],
+                nodata=src.nodata, crs=crs or src.crs, transform=transform, tiled=True,
+                blockxsize=COG_BLOCK, blockysize=COG_BLOCK, compress=COG_COMPRESS, zlevel=1,
+                bigtiff="IF_SAFER")
+
+def download_mosaic(url_for: Callable[[Window, Affine], str], path: str, transform: Affine, width: int,
+                    height: int, crs=None, tile_px: int = EXPORT_TILE_PX, workers: int = EXPORT_WORKERS,
+                    transport=None, retry: Callable | None = None) -> str:
+    """Download the `width` x `height` grid at `transform` in `tile_px` sub-images into `path`.
+
+    `retry(fn)` wraps each sub-image (URL request + download), so one failed tile is
+    retried on its own. The mosaic is written to `<path>.part` and renamed on success.
+    """
+    transport = transport or HTTPTransport()
+    retry = retry or (lambda fn: fn())
+    windows = [inner for inner, _ in iter_tiles(height, width, (tile_px, tile_px))]
+
+    def fetch(win: Window) -> bytes:
+        return retry(lambda: _geotiff(transport.get(url_for(win, window_transform(win, transform)))))
+
+    part, dst = path + ".part", None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # each tile runs in a copy of the caller's context, so round-trips count on its span
+            jobs = {pool.submit(contextvars.copy_context().run, fetch, win): win for win in windows}
+            try:
+                for job in as_completed(jobs):
+                    win = jobs.pop(job)  # drop the finished tile's bytes as soon as it is written
+                    with MemoryFile(job.result()) as mem, mem.open() as src:
+                        if (src.height, src.width) != (win.height, win.width):
+                            raise RuntimeError(f"tile {win} came back {src.width}x{src.height}")
+                        if dst is None:
+                            dst = rasterio.open(part, "w", **_mosaic_profile(src, transform, width, height, crs))
+                        dst.write(src.read(), window=win)
+            except BaseException:
+                for job in jobs:
+                    job.cancel()
+                raise
+        dst.close(); dst = None
+        os.replace(part, path)
+    finally:
+        if dst is not None:
+            dst.close()
+        if os.path.exists(part):
+            os.remove(part)
+    return path
@@ -1,8 +1,32 @@
 import os
 import json
+import random
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
 import ee
-import geemap
 import geopandas as gpd
+import numpy as np
+import rasterio
+
+# Works both as `src.gee_pipeline` (CLI) and as a top-level module (Streamlit app)
+try:
+    from .cache import cache_key
+    from .cog import MASK_NODATA, mask_profile, to_cog
+    from .download import DEG_PER_M, EXPORT_TILE_PX, download_mosaic, export_grid
+    from .instrument import Tracer, download_url, get_info
+    from .utils import TRANSITION_CLASSES, transition_areas
+except ImportError:
+    from cache import cache_key
+    from cog import MASK_NODATA, mask_profile, to_cog
+    from download import DEG_PER_M, EXPORT_TILE_PX, download_mosaic, export_grid
+    from instrument import Tracer, download_url, get_info
+    from utils import TRANSITION_CLASSES, transition_areas
+
+DATASETS = ("COPERNICUS/S2_SR_HARMONIZED", "MODIS/061/MOD13Q1")
+SCALE = 30
+MAX_CONCURRENCY = 2  # stats request + change map export
+RETRIES = 4
 
 # ------------------ Initialize Earth Engine ------------------
 def _init_ee():
@@ -18,73 +42,121 @@ def _init_ee():
 
 
 # ------------------ Load AOI ------------------
-def load_aoi(aoi_path):
+def load_aoi_geometry(aoi_path):
     gdf = gpd.read_file(aoi_path)
     geojson = json.loads(gdf.to_json())
-    region = ee.Geometry(geojson["features"][0]["geometry"])
+    return geojson["features"][0]["geometry"]
+
+
+def load_aoi(aoi_path):
+    region = ee.Geometry(load_aoi_geometry(aoi_path))
     print("🌍 AOI loaded successfully.")
     return region
 
 
+# ------------------ Earth Engine client ------------------
+class EEClient:
+    """The only place that blocks on Earth Engine (session, getInfo, download URLs);
+    swap in a fake, together with a stubbed `ee`, to count round-trips in tests."""
+    def __init__(self):
+        self._ready = False
+
+    def initialize(self):
+        # one session per client, so batch runs share a single initialization
+        if not self._ready:
+            _init_ee()
+            self._ready = True
+
+    def get_info(self, obj):
+        return get_info(obj)
+
+    def download_url(self, image, params):
+        return download_url(image, params)
+
+
+# ------------------ Retry / backoff ------------------
+def _is_rate_limited(err):
+    msg = str(err).lower()
+    return any(t in msg for t in ("too many", "rate limit", "quota", "429", "503", "timed out"))
+
+
+def _is_transient(err):
+    # rate limits plus download hiccups (5xx, resets, timeouts); bad requests fail at once
+    if isinstance(err, urllib.error.HTTPError):
+        return err.code == 429 or err.code >= 500
+    return isinstance(err, (ConnectionError, TimeoutError, urllib.error.URLError)) or _is_rate_limited(err)
+
+
+def with_retry(fn, *args, retries=RETRIES, backoff=2.0, retry_if=_is_rate_limited):
+    """Call fn(*args), retrying with jittered exponential backoff while retry_if(error) holds."""
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == retries or not retry_if(e):
+                raise
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+            print(f"⏳ Earth Engine busy ({e}); retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+
 # ------------------ Sentinel-2 NDVI ------------------
+def _modis_ndvi(start, end, region):
+    return (
+        ee.ImageCollection("MODIS/061/MOD13Q1")
+        .filterBounds(region)
+        .filterDate(start, end)
+        .select("NDVI")
+        .mean()
+        .divide(10000)
+        .rename("NDVI")
+    )
+
+
 def get_s2_ndvi(start, end, region, cloud_prob):
     """
-    Returns median NDVI image for the given date range and AOI.
-    Includes robust checks and a fallback to MODIS NDVI if Sentinel-2 is unavailable.
+    Returns (median NDVI image, ee.Dictionary of metadata) for the date range and AOI.
+    The cloud-filter relaxation and the MODIS fallback are decided server-side with
+    ee.Algorithms.If, so nothing here blocks on the network.
     """
-    data_source = "Sentinel-2"
-
-    s2 = (
+    base = (
         ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
         .filterBounds(region)
         .filterDate(start, end)
-        .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", cloud_prob))
     )
-
-    count = s2.size().getInfo()
-    if count == 0:
-        print(f"⚠️ No Sentinel-2 images found for {start}–{end}. Relaxing filters...")
-        s2 = (
-            ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
-            .filterBounds(region)
-            .filterDate(start, end)
-        )
-        count = s2.size().getInfo()
-
-        if count == 0:
-            print("🌍 Falling back to MODIS NDVI (MOD13Q1)...")
-            data_source = "MODIS"
-            modis = (
-                ee.ImageCollection("MODIS/061/MOD13Q1")
-                .filterBounds(region)
-                .filterDate(start, end)
-                .select("NDVI")
-                .mean()
-                .divide(10000)
-                .rename("NDVI")
-            )
-            return modis, data_source
+    filtered = base.filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", cloud_prob))
+    count_filtered = filtered.size()
+    s2 = ee.ImageCollection(ee.Algorithms.If(count_filtered.gt(0), filtered, base))
+    count = s2.size()
 
     s2_median = s2.median()
-    bands = s2_median.bandNames().getInfo()
-    print(f"✅ Found Sentinel-2 images ({count}) with bands: {bands}")
-
-    if not all(b in bands for b in ["B8", "B4"]):
-        print(f"⚠️ Sentinel-2 image missing required bands ({bands}), using MODIS fallback...")
-        data_source = "MODIS"
-        modis = (
-            ee.ImageCollection("MODIS/061/MOD13Q1")
-            .filterBounds(region)
-            .filterDate(start, end)
-            .select("NDVI")
-            .mean()
-            .divide(10000)
-            .rename("NDVI")
-        )
-        return modis, data_source
-
-    ndvi = s2_median.normalizedDifference(["B8", "B4"]).rename("NDVI")
-    return ndvi, data_source
+    bands = s2_median.bandNames()
+    use_s2 = count.gt(0).And(bands.containsAll(["B8", "B4"]))
+
+    ndvi = ee.Image(ee.Algorithms.If(
+        use_s2,
+        s2_median.normalizedDifference(["B8", "B4"]).rename("NDVI"),
+        _modis_ndvi(start, end, region),
+    ))
+    meta = ee.Dictionary({
+        "count_filtered": count_filtered,
+        "count": count,
+        "bands": bands,
+        "source": ee.Algorithms.If(use_s2, "Sentinel-2", "MODIS"),
+    })
+    return ndvi, meta
+
+
+def _log_source(start, end, meta):
+    if meta["count_filtered"] == 0:
+        print(f"⚠️ No Sentinel-2 images found for {start}–{end}. Relaxed cloud filter.")
+    if meta["source"] == "MODIS":
+        if meta["count"] == 0:
+            print("🌍 Fell back to MODIS NDVI (MOD13Q1)...")
+        else:
+            print(f"⚠️ Sentinel-2 image missing required bands ({meta['bands']}), used MODIS fallback...")
+    else:
+        print(f"✅ Found Sentinel-2 images ({meta['count']}) with bands: {meta['bands']}")
 
 
 
@@ -94,58 +166,240 @@ def forest_mask(ndvi_image, threshold):
 
 
 # ------------------ Area Calculation ------------------
-def calc_area(mask, region):
+def area_ha(mask, region):
+    """Forest hectares as a server-side ee.Number (0 when the mask is empty)."""
     area_img = mask.multiply(ee.Image.pixelArea()).divide(10000)
     stats = area_img.reduceRegion(
         reducer=ee.Reducer.sum(),
         geometry=region,
-        scale=30,
+        scale=SCALE,
         maxPixels=1e13,
     )
-    return stats.getInfo().get("ForestMask", 0)
+    return ee.Number(ee.Algorithms.If(stats.get("ForestMask"), stats.get("ForestMask"), 0))
+
+
+# ------------------ Change Map ------------------
+def change_image(mask_past, mask_now):
+    """uint8 transition code past*2 + present (see utils.TRANSITION_CLASSES)."""
+    past = mask_past.unmask(0).gt(0)
+    now = mask_now.unmask(0).gt(0)
+    return past.multiply(2).add(now).uint8().rename("change")
+
+
+def transition_ha(change, region):
+    """
+    Hectares per transition class as a server-side ee.List of {"class", "sum"}.
+    One grouped sum of pixelArea over the change codes: a frequencyHistogram would
+    count (weighted) pixels, not m², and still need a second pass for area.
+    """
+    stats = (
+        ee.Image.pixelArea().divide(10000).addBands(change)
+        .reduceRegion(
+            reducer=ee.Reducer.sum().group(groupField=1, groupName="class"),
+            geometry=region,
+            scale=SCALE,
+            maxPixels=1e13,
+        )
+    )
+    return stats.get("groups")
+
+
+def _class_ha(groups):
+    class_ha = [0.0] * len(TRANSITION_CLASSES)
+    for g in groups or []:
+        class_ha[int(g["class"])] = g["sum"] or 0
+    return class_ha
+
+
+def split_change_map(out_dir="outputs", filename="change_map.tif"):
+    """
+    Write forest_mask_past/present.tif (0/1 COGs) from an exported change map, block by block.
+    Pixels masked in the change map (outside the AOI) stay MASK_NODATA, so readers
+    do not count them as non-forest.
+    """
+    src_path = os.path.join(out_dir, filename)
+    outputs = [os.path.join(out_dir, f) for f in ("forest_mask_past.tif", "forest_mask_present.tif")]
+    with rasterio.open(src_path) as src:
+        profile = mask_profile(src.profile, nodata=MASK_NODATA)
+        with rasterio.open(outputs[0], "w", **profile) as past, \
+             rasterio.open(outputs[1], "w", **profile) as now:
+            for _, win in src.block_windows(1):
+                code = src.read(1, window=win, masked=True)
+                outside = np.ma.getmaskarray(code)
+                code = code.filled(0).astype("uint8")
+                past.write(np.where(outside, MASK_NODATA, code >> 1).astype("uint8"), 1, window=win)
+                now.write(np.where(outside, MASK_NODATA, code & 1).astype("uint8"), 1, window=win)
+    for path in outputs:
+        to_cog(path)
+
+
+AREA_BANDS = ["total_area_ha", "forest_area_past_ha", "forest_area_present_ha", "forest_loss_ha",
+              "forest_gain_ha"]
+
+
+def calc_area_many(mask_past, mask_now, features, scale=SCALE):
+    """
+    Per-feature hectares (AREA_BANDS) for every feature of `features` from one
+    reduceRegions over a combined total/past/present/loss/gain band image.
+    Geometries are dropped from the result so fetching it stays small.
+    """
+    change = change_image(mask_past, mask_now)
+    bands = (
+        ee.Image.cat([ee.Image.constant(1), change.gte(2), change.bitwiseAnd(1),
+                      change.eq(2), change.eq(1)])
+        .rename(AREA_BANDS)
+        .multiply(ee.Image.pixelArea())
+        .divide(10000)
+    )
+    stats = bands.reduceRegions(collection=features, reducer=ee.Reducer.sum(), scale=scale)
+    return stats.select(["fid"] + AREA_BANDS, None, False)
 
 
 # ------------------ Local Export ------------------
-def export_image_local(image, filename, region, scale=30):
-    os.makedirs("outputs", exist_ok=True)
-    path = os.path.abspath(os.path.join("outputs", filename))
+EXPORT_CRS = "EPSG:4326"
+
+
+def _coords(c):
+    if isinstance(c[0], (int, float)):
+        yield c
+    else:
+        for part in c:
+            yield from _coords(part)
+
+
+def region_bounds(region, client=None):
+    """(west, south, east, north) of `region`; no round-trip when it was built from GeoJSON."""
     try:
-        print(f"🛰️ Exporting {filename} ...")
-        geemap.ee_export_image(
-            image.clip(region),
-            filename=path,
-            scale=scale,
-            region=region,
-            file_per_band=False,
-        )
-        print(f"✅ Exported: {path}")
+        geojson = region.toGeoJSON()
+    except ee.EEException:  # computed geometry: ask the server for its bounds
+        geojson = with_retry((client or EEClient()).get_info, region.bounds(1))
+    xs, ys = zip(*(pt[:2] for pt in _coords(geojson["coordinates"])))
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def export_image(image, filename, region, scale=SCALE, out_dir="outputs", transport=None, client=None):
+    """
+    Export to <out_dir>/<filename> and return its path; raises if the export fails.
+    The region's bounding grid is split into EXPORT_TILE_PX sub-images, each under
+    the getDownloadURL size cap, downloaded concurrently and mosaicked on disk.
+    """
+    client = client or EEClient()
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.abspath(os.path.join(out_dir, filename))
+    if os.path.exists(path):
+        os.remove(path)  # never leave a stale mask behind a failed export
+    clipped = image.clip(region)
+
+    def url_for(win, transform):
+        return client.download_url(clipped, {
+            "crs": EXPORT_CRS, "crs_transform": list(transform)[:6],
+            "dimensions": f"{int(win.width)}x{int(win.height)}", "format": "GEO_TIFF",
+        })
+
+    transform, width, height = export_grid(region_bounds(region, client), scale * DEG_PER_M)
+    tiles = -(-width // EXPORT_TILE_PX) * -(-height // EXPORT_TILE_PX)
+    print(f"🛰️ Exporting {filename} ({width}x{height} px, {tiles} tile(s)) ...")
+    download_mosaic(url_for, path, transform, width, height, crs=EXPORT_CRS, tile_px=EXPORT_TILE_PX,
+                    transport=transport, retry=lambda fn: with_retry(fn, retry_if=_is_transient))
+    print(f"✅ Exported: {path}")
+    return path
+
+
+def export_image_local(image, filename, region, scale=SCALE, out_dir="outputs", transport=None, client=None):
+    """`export_image` that reports failure instead of raising; returns True if the file was written."""
+    try:
+        export_image(image, filename, region, scale, out_dir, transport, client)
     except Exception as e:
         print(f"❌ Export failed: {e}")
+    return os.path.exists(os.path.join(out_dir, filename))
 
 
 # ------------------ Save Report ------------------
-def save_report(data):
-    os.makedirs("outputs", exist_ok=True)
-    with open("outputs/deforestation_report.json", "w") as f:
+def save_report(data, out_dir="outputs"):
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, "deforestation_report.json")
+    with open(path, "w") as f:
         json.dump(data, f, indent=4)
-    print("📄 Report saved → outputs/deforestation_report.json")
+    print(f"📄 Report saved → {path}")
 
 
 # ------------------ Run Pipeline ------------------
-def run(aoi_path, t0, t1, ndvi_thresh, cloud_prob):
-    _init_ee()
-    region = load_aoi(aoi_path)
-
-    print("🕒 Fetching NDVI composites...")
-    ndvi_past, source_past = get_s2_ndvi(t0[0], t0[1], region, cloud_prob)
-    ndvi_now, source_now = get_s2_ndvi(t1[0], t1[1], region, cloud_prob)
-
-
-    mask_past = forest_mask(ndvi_past, ndvi_thresh)
-    mask_now = forest_mask(ndvi_now, ndvi_thresh)
-
-    forest_area_t0 = calc_area(mask_past, region)
-    forest_area_t1 = calc_area(mask_now, region)
+def run(aoi_path, t0, t1, ndvi_thresh, cloud_prob, tracer=None, client=None, cache=None,
+        geometry=None, out_dir="outputs", region_name="AOI"):
+    """Past/present forest change for one AOI (file at `aoi_path`, or a GeoJSON `geometry`)."""
+    tracer = tracer or Tracer()
+    client = client or EEClient()
+    if geometry is None:
+        with tracer.span("load_aoi"):
+            geometry = load_aoi_geometry(aoi_path)
+    periods = {"past": tuple(t0), "present": tuple(t1)}
+    export = "change_map.tif"
+    keys = {kind: cache_key(kind, geometry, [list(w) for w in periods.values()], cloud_prob, ndvi_thresh,
+                            SCALE, DATASETS)
+            for kind in ("transitions", "change_map")}
+
+    # cached stats / change map skip Earth Engine entirely
+    info, restored, export_error = None, False, None
+    if cache is not None:
+        info = cache.get_json(keys["transitions"])
+        restored = cache.get_file(keys["change_map"], os.path.join(out_dir, export))
+
+    if info is None or not restored:
+        with tracer.span("init_ee"):
+            client.initialize()
+        region = ee.Geometry(geometry)
+        print("🕒 Fetching NDVI composites...")
+        masks, metas = {}, {}
+        for p, (start, end) in periods.items():
+            ndvi, metas[p] = get_s2_ndvi(start, end, region, cloud_prob)
+            masks[p] = forest_mask(ndvi, ndvi_thresh)
+        change = change_image(masks["past"], masks["present"])
+
+        # one round-trip for both periods' metadata and every class area, run alongside the export
+        def fetch_stats():
+            with tracer.span("fetch_stats"):
+                return with_retry(client.get_info, ee.Dictionary({
+                    **metas, "transitions": transition_ha(change, region),
+                }))
+
+        def export_change():
+            with tracer.span("export_change", cached=False) as sp:
+                try:
+                    export_image(change, export, region, out_dir=out_dir, client=client)
+                except Exception as e:
+                    print(f"❌ Export failed: {e}")
+                    sp.add(bytes_written=0)
+                    return f"{export}: {e}"
+                # the mosaic is a plain tiled GeoTIFF; cache and keep the compact COG
+                to_cog(os.path.join(out_dir, export))
+                if cache is not None:
+                    cache.put_file(keys["change_map"], os.path.join(out_dir, export))
+                sp.add(bytes_written=_file_size(export, out_dir))
+
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as pool:
+            stats_job = pool.submit(fetch_stats) if info is None else None
+            export_job = pool.submit(export_change) if not restored else None
+            if stats_job:
+                info = stats_job.result()
+                if cache is not None:
+                    cache.put_json(keys["transitions"], info)
+            if export_job:
+                export_error = export_job.result()
+    else:
+        print("⚡ Using cached NDVI stats and change map.")
+    if restored:
+        with tracer.span("export_change", cached=True) as sp:
+            print(f"⚡ {export} restored from cache.")
+            sp.add(bytes_written=_file_size(export, out_dir))
+    if os.path.exists(os.path.join(out_dir, export)):
+        with tracer.span("split_masks"):
+            split_change_map(out_dir, export)
+    _log_source(t0[0], t0[1], info["past"])
+    _log_source(t1[0], t1[1], info["present"])
+    source_past, source_now = info["past"]["source"], info["present"]["source"]
+    areas = transition_areas(_class_ha(info["transitions"]))
+    forest_area_t0 = areas["forest_area_past_ha"]
+    forest_area_t1 = areas["forest_area_present_ha"]
 
     # Change detection
     if forest_area_t0 > 0:
@@ -159,23 +413,62 @@ def run(aoi_path, t0, t1, ndvi_thresh, cloud_prob):
         change_type = "Gain"
 
     report = {
-    "region": "AOI",
+    "region": region_name,
     "past_window": t0,
     "present_window": t1,
     "forest_area_past_ha": round(forest_area_t0, 2),
     "forest_area_present_ha": round(forest_area_t1, 2),
+    "forest_loss_ha": round(areas["forest_loss_ha"], 2),
+    "forest_gain_ha": round(areas["forest_gain_ha"], 2),
+    "net_change_ha": round(areas["net_change_ha"], 2),
+    "stable_forest_ha": round(areas["stable_forest_ha"], 2),
     "change_percent": round(abs(change_percent), 2),
     "change_type": change_type,
     "ndvi_threshold_used": ndvi_thresh,
     "data_source_past": source_past,
-    "data_source_present": source_now
+    "data_source_present": source_now,
+    # None when the change map (and the masks split from it) could not be exported
+    "change_map": os.path.join(out_dir, export) if export_error is None else None,
+    "export_error": export_error,
 }
 
 
-    # Save & export
-    save_report(report)
-    export_image_local(mask_past, "forest_mask_past.tif", region)
-    export_image_local(mask_now, "forest_mask_present.tif", region)
+    # Save
+    report["instrumentation"] = tracer.summary()
+    save_report(report, out_dir)
 
     print("✅ Pipeline finished successfully.")
     return report
+
+
+def run_many(features, t0, t1, ndvi_thresh, cloud_prob, tracer=None, client=None):
+    """
+    Forest past/present/loss/gain hectares for many AOIs in one Earth Engine request.
+    `features` is a list of (feature_id, GeoJSON geometry); composites are built
+    over the union of all features. Returns (per-feature dicts, period metadata).
+    """
+    tracer = tracer or Tracer()
+    client = client or EEClient()
+    with tracer.span("init_ee"):
+        client.initialize()
+    fc = ee.FeatureCollection([ee.Feature(ee.Geometry(g), {"fid": fid}) for fid, g in features])
+    region = fc.geometry()
+    ndvi_past, meta_past = get_s2_ndvi(t0[0], t0[1], region, cloud_prob)
+    ndvi_now, meta_now = get_s2_ndvi(t1[0], t1[1], region, cloud_prob)
+    stats = calc_area_many(forest_mask(ndvi_past, ndvi_thresh), forest_mask(ndvi_now, ndvi_thresh), fc)
+    with tracer.span("fetch_stats", features=len(features)):
+        info = with_retry(client.get_info, ee.Dictionary({
+            "past": meta_past, "present": meta_now, "features": stats,
+        }))
+    _log_source(t0[0], t0[1], info["past"])
+    _log_source(t1[0], t1[1], info["present"])
+    rows = []
+    for feat in info["features"]["features"]:
+        props = feat["properties"]
+        rows.append({"fid": props["fid"], **{b: props.get(b) or 0 for b in AREA_BANDS}})
+    return rows, {"past": info["past"], "present": info["present"]}
+
+
+def _file_size(filename, out_dir="outputs"):
+    path = os.path.join(out_dir, filename)
+    return os.path.getsize(path) if os.path.exists(path) else 0
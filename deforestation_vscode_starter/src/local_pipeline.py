@@ -1,76 +1,359 @@
 from __future__ import annotations
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 import numpy as np, rasterio
-from skimage.filters import threshold_otsu
-from skimage.morphology import binary_closing, remove_small_objects, disk
-from typing import Dict, Any, Tuple
-from .utils import ensure_dirs, save_report, percent_from_areas, save_preview_change
+from functools import partial
+from typing import Dict, Any, Iterator, Sequence, Tuple
+from .area import class_areas, row_areas
+from .cog import mask_profile, to_cog
+from .histogram import NDVIHistogram
+from .instrument import StageTimer, Tracer
+from .kernels import fused_ndvi
+from .mmapio import MappedReader
+from .patches import PatchIndex, close_disk, label_tile, remove_small_patches, write_patches
+from .tiling import tile_shape_for, halo_for, iter_tiles, inner_slices, clean_tile, map_tiles
+from .utils import ensure_dirs, save_report, percent_from_areas, save_preview_change, transition_areas
+
+PREVIEW_MAX_PX = 1024
+OUTPUT_MASKS = ("forest_mask_past.tif", "forest_mask_present.tif", "deforest_mask.tif", "change_map.tif")
+OUTPUT_NBITS = (1, 1, 1, 2)
+LOSS = 2  # change code past*2 + present: 0 stable non-forest, 1 gain, 2 loss, 3 stable forest
+LOSS_PATCHES = "loss_patches.csv"  # deforestation events, one row per loss patch
 
 def compute_ndvi(red: np.ndarray, nir: np.ndarray) -> np.ndarray:
-    red = red.astype("float32"); nir = nir.astype("float32")
-    return (nir - red) / np.clip(nir + red, 1e-6, None)
+    ndvi = np.empty(red.shape, dtype="float32")
+    fused_ndvi(red, nir, ndvi_out=ndvi)
+    return ndvi
 
-def read_band(path: str) -> Tuple[np.ndarray, float]:
-    with rasterio.open(path) as ds:
-        band = ds.read(1)
-        # pixel area from transform (assumes meters; ensure projected CRS)
-        pix_area = abs(ds.transform.a * ds.transform.e)
-    return band, pix_area
+def ndvi_forest_mask(red: np.ndarray, nir: np.ndarray, thresh: float,
+                     hist: NDVIHistogram | None = None) -> Tuple[np.ndarray, int]:
+    """NDVI > thresh and its pixel count, without materializing the NDVI array."""
+    mask = np.empty(red.shape, dtype=bool)
+    return mask, fused_ndvi(red, nir, thresh, mask_out=mask, hist=hist)
 
-def run(red_past: str, nir_past: str, red_present: str, nir_present: str,
-        ndvi_thresh: float | None, min_patch_pixels: int, morph_radius: int) -> Dict[str,Any]:
-    ensure_dirs()
-    r0, pa0 = read_band(red_past); n0, _ = read_band(nir_past)
-    r1, pa1 = read_band(red_present); n1, _ = read_band(nir_present)
-    if abs(pa0 - pa1) > 1e-6:
-        print("Warning: pixel areas differ between rasters. Using past's pixel area for area calc.")
-    pix_area = pa0
+@contextmanager
+def open_inputs(paths: Sequence[str]) -> Iterator[Tuple[MappedReader, ...]]:
+    """A reader per path, opening each distinct file once (red and NIR may share a stack)."""
+    with ExitStack() as stack:
+        opened: Dict[str, MappedReader] = {}
+        for p in paths:
+            if p not in opened:
+                opened[p] = MappedReader(stack.enter_context(rasterio.open(p)))
+        yield tuple(opened[p] for p in paths)
 
-    ndvi0 = compute_ndvi(r0, n0)
-    ndvi1 = compute_ndvi(r1, n1)
+def check_bands(red_path: str, nir_path: str, red_band: int, nir_band: int):
+    """Reject red and NIR resolving to the same band of the same file (NDVI would be 0 everywhere)."""
+    if os.path.abspath(red_path) == os.path.abspath(nir_path) and red_band == nir_band:
+        raise ValueError(f"Red and NIR are both band {red_band} of {red_path}; "
+                         "pass different --red-band / --nir-band for a multi-band stack")
 
-    mask0 = ndvi0 > (threshold_otsu(ndvi0[np.isfinite(ndvi0)]) if ndvi_thresh is None else ndvi_thresh)
-    mask1 = ndvi1 > (threshold_otsu(ndvi1[np.isfinite(ndvi1)]) if ndvi_thresh is None else ndvi_thresh)
+def read_pair(red, nir, bands: Tuple[int, int] = (1, 1), window=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Red and NIR pixels. Bands of one stack come from a single `read([r, n])` call
+    unless both are memory-mapped, in which case they are zero-copy views."""
+    if red is nir and bands[0] == bands[1]:
+        raise ValueError(f"Red and NIR are the same band ({bands[0]}) of one file")
+    if red is nir and not (red.is_mapped(bands[0]) and red.is_mapped(bands[1])):
+        both = red.read(list(bands), window=window)
+        return both[0], both[1]
+    return red.read(bands[0], window=window), nir.read(bands[1], window=window)
 
-    # clean small speckles
+def _row_areas(ds) -> np.ndarray:
+    return row_areas(ds.crs, ds.transform, ds.height)
+
+def _check_areas(ra0: np.ndarray, ra1: np.ndarray):
+    if ra0.shape != ra1.shape or not np.allclose(ra0, ra1, rtol=0, atol=1e-6):
+        print("Warning: pixel areas differ between rasters. Using past's pixel area for area calc.")
+
+def period_mask(red: np.ndarray, nir: np.ndarray, ndvi_thresh: float | None, min_patch_pixels: int,
+                morph_radius: int) -> Tuple[np.ndarray, NDVIHistogram]:
+    """Cleaned forest mask for one period (the same steps `run` applies) and its NDVI histogram."""
+    hist = NDVIHistogram()
+    if ndvi_thresh is None:
+        ndvi = compute_ndvi(red, nir)
+        mask = ndvi > hist.update(ndvi).otsu(); del ndvi
+    else:
+        mask, _ = ndvi_forest_mask(red, nir, ndvi_thresh, hist)
     if morph_radius > 0:
-        mask0 = binary_closing(mask0, disk(morph_radius))
-        mask1 = binary_closing(mask1, disk(morph_radius))
+        mask = close_disk(mask, morph_radius)
     if min_patch_pixels > 0:
-        mask0 = remove_small_objects(mask0, min_size=min_patch_pixels)
-        mask1 = remove_small_objects(mask1, min_size=min_patch_pixels)
+        mask = remove_small_patches(mask, min_patch_pixels)
+    return mask, hist
 
-    past_area_m2 = int(mask0.sum()) * pix_area
-    pres_area_m2 = int(mask1.sum()) * pix_area
-    past_ha = past_area_m2 / 10000.0
-    pres_ha = pres_area_m2 / 10000.0
-    remaining, loss = percent_from_areas(past_ha, pres_ha)
+def change_code(mask0: np.ndarray, mask1: np.ndarray) -> np.ndarray:
+    """uint8 transition code past*2 + present."""
+    code = np.left_shift(mask0, 1, dtype=np.uint8)
+    code |= mask1
+    return code
 
-    report = {
+def _make_report(total_m2: float, class_m2: np.ndarray,
+                 ndvi_thresh: float | None, hists: Tuple[NDVIHistogram, NDVIHistogram]) -> Dict[str,Any]:
+    areas = transition_areas(class_m2 / 10000.0)
+    remaining, loss = percent_from_areas(areas["forest_area_past_ha"], areas["forest_area_present_ha"])
+    return {
         "region": "AOI",
         "past_window": ["(local)", "(local)"],
         "present_window": ["(local)", "(local)"],
-        "total_area_ha": round((mask0.size * pix_area)/10000.0, 2),
-        "forest_area_past_ha": round(past_ha, 2),
-        "forest_area_present_ha": round(pres_ha, 2),
+        "total_area_ha": round(total_m2/10000.0, 2),
+        **{k: round(v, 2) for k, v in areas.items()},
         "remaining_percent": round(remaining, 2),
         "deforestation_percent": round(loss, 2),
-        "ndvi_threshold_used": (ndvi_thresh if ndvi_thresh is not None else "Otsu")
+        "ndvi_threshold_used": (ndvi_thresh if ndvi_thresh is not None else "Otsu"),
+        "ndvi_stats": {"past": hists[0].stats(), "present": hists[1].stats()},
     }
+
+def run(red_past: str, nir_past: str, red_present: str, nir_present: str,
+        ndvi_thresh: float | None, min_patch_pixels: int, morph_radius: int,
+        tile_size: int | None = None, workers: int = 1,
+        tracer: Tracer | None = None, red_band: int = 1, nir_band: int = 1) -> Dict[str,Any]:
+    """Past/present forest change from red/NIR rasters. Red and NIR may be two bands
+    (`red_band`, `nir_band`) of one multi-band file: pass the same path for both."""
+    check_bands(red_past, nir_past, red_band, nir_band)
+    check_bands(red_present, nir_present, red_band, nir_band)
+    ensure_dirs()
+    if tile_size or workers > 1:
+        return run_tiled(red_past, nir_past, red_present, nir_present, ndvi_thresh,
+                         min_patch_pixels, morph_radius, tile_size or 1024, workers, tracer,
+                         red_band, nir_band)
+    tracer = tracer or Tracer()
+    bands = (red_band, nir_band)
+    with tracer.span("read") as sp:
+        with open_inputs((red_past, nir_past, red_present, nir_present)) as (rd0, nd0, rd1, nd1):
+            r0, n0 = read_pair(rd0, nd0, bands); r1, n1 = read_pair(rd1, nd1, bands)
+            profile = rd0.profile; row_area = _row_areas(rd0)
+            _check_areas(row_area, _row_areas(rd1))
+        sp.add(bytes_read=r0.nbytes + n0.nbytes + r1.nbytes + n1.nbytes)
+
+    # NDVI histograms drive Otsu and the report's NDVI stats; a fixed threshold is
+    # applied inside the fused NDVI pass, so only Otsu has a separate threshold stage
+    hists = (NDVIHistogram(), NDVIHistogram())
+    masks = []
+    for period, (red, nir), hist in zip(("past", "present"), ((r0, n0), (r1, n1)), hists):
+        with tracer.span("ndvi", period=period, fused_threshold=ndvi_thresh is not None):
+            if ndvi_thresh is None:
+                ndvi = compute_ndvi(red, nir); hist.update(ndvi)
+            else:
+                mask, _ = ndvi_forest_mask(red, nir, ndvi_thresh, hist)
+        if ndvi_thresh is None:
+            with tracer.span("threshold", period=period):
+                mask = ndvi > hist.otsu(); del ndvi
+        masks.append(mask)
+    mask0, mask1 = masks; del masks, mask
+
+    # clean small speckles
+    if morph_radius > 0:
+        with tracer.span("closing"):
+            mask0 = close_disk(mask0, morph_radius)
+            mask1 = close_disk(mask1, morph_radius)
+    if min_patch_pixels > 0:
+        with tracer.span("small_objects"):
+            mask0 = remove_small_patches(mask0, min_patch_pixels)
+            mask1 = remove_small_patches(mask1, min_patch_pixels)
+
+    with tracer.span("areas"):
+        code = change_code(mask0, mask1)
+        # change = forest at t0 and not at t1
+        change_mask = (code == LOSS).view(np.uint8)
+        report = _make_report(float(row_area.sum()) * code.shape[1], class_areas(code, row_area),
+                              ndvi_thresh, hists)
+    with tracer.span("loss_patches"):
+        index = PatchIndex(); index.add(change_mask.view(bool), row_area=row_area)
+        report["loss_patches"] = _write_loss_patches(index, min_patch_pixels, profile)
+    with tracer.span("preview"):
+        save_preview_change(change_mask)
+
+    # Save masks as COGs on past's grid
+    with tracer.span("write") as sp:
+        arrays = (mask0.view(np.uint8), mask1.view(np.uint8), change_mask, code)
+        for name, nbits, arr in zip(OUTPUT_MASKS, OUTPUT_NBITS, arrays):
+            with rasterio.open(os.path.join("outputs", name), "w", **mask_profile(profile, nbits)) as dst:
+                dst.write(arr, 1)
+    with tracer.span("cog") as sp:
+        _finish_cogs()
+        sp.add(bytes_written=_output_bytes())
+
+    report["instrumentation"] = tracer.summary()
     save_report(report)
+    return report
+
+def run_tiled(red_past: str, nir_past: str, red_present: str, nir_present: str,
+              ndvi_thresh: float | None, min_patch_pixels: int, morph_radius: int,
+              tile_size: int = 1024, workers: int = 1,
+              tracer: Tracer | None = None, red_band: int = 1, nir_band: int = 1) -> Dict[str,Any]:
+    """Same result as `run`, streamed tile by tile so memory scales with `tile_size`.
 
-    # change = forest at t0 and not at t1
-    change_mask = (mask0 & (~mask1)).astype(np.uint8)
-    save_preview_change(change_mask)
-
-    # Save masks as simple GeoTIFF using past's profile
-    with rasterio.open(red_past) as src:
-        profile = src.profile
-        profile.update(count=1, dtype="uint8")
-        with rasterio.open("outputs/forest_mask_past.tif", "w", **profile) as dst:
-            dst.write(mask0.astype("uint8"), 1)
-        with rasterio.open("outputs/forest_mask_present.tif", "w", **profile) as dst:
-            dst.write(mask1.astype("uint8"), 1)
-        with rasterio.open("outputs/deforest_mask.tif", "w", **profile) as dst:
-            dst.write(change_mask, 1)
+    With `workers > 1` tiles are processed on a process pool: workers also measure
+    their tiles and label their loss patches, so the parent only merges small per-tile
+    summaries while a writer thread writes the finished tiles. Otsu thresholds come
+    from a first pass that merges per-tile NDVI histograms. How throughput scales
+    with `workers` depends on the host; measure it with benchmarks/bench_local.py.
+    """
+    ensure_dirs()
+    tracer = tracer or Tracer()
+    paths = (red_past, nir_past, red_present, nir_present); bands = (red_band, nir_band)
+    with open_inputs(paths) as datasets, ExitStack() as pools:
+        # one pool for both passes: worker start-up (and their open handles) is paid once
+        pool = pools.enter_context(ProcessPoolExecutor(max_workers=workers)) if workers > 1 else None
+        r0, n0, r1, n1 = datasets
+        if (r1.height, r1.width) != (r0.height, r0.width):
+            raise ValueError("Tiled mode needs all rasters on the same grid")
+        row_area = _row_areas(r0)
+        _check_areas(row_area, _row_areas(r1))
+        height, width = r0.height, r0.width
+        halo = halo_for(morph_radius, min_patch_pixels)
+        step = -(-max(height, width) // PREVIEW_MAX_PX)
+        preview = np.zeros((-(-height // step), -(-width // step)), dtype=np.uint8)
+        profile = r0.profile
+        tile_shape = tile_shape_for(r0, tile_size)
+        hists = (NDVIHistogram(), NDVIHistogram())
+        if ndvi_thresh is None:
+            with tracer.span("otsu_pass", workers=workers) as sp:
+                timer = StageTimer()
+                for h0, h1, seconds in map_tiles(_bind(_tile_hist, paths, datasets, bands, workers),
+                                                 [(inner,) for inner, _ in iter_tiles(height, width, tile_shape)],
+                                                 workers, pool):
+                    hists[0].merge(h0); hists[1].merge(h1); timer.merge(seconds)
+                with timer("threshold"):
+                    thresholds = (hists[0].otsu(), hists[1].otsu())
+                # stage seconds summed over tiles (and workers), so they can exceed wall_s
+                sp.add(bytes_read=_input_bytes(datasets, bands), stage_s=timer.rounded())
+        else:
+            thresholds = (ndvi_thresh, ndvi_thresh)
+        # with a fixed threshold the mask pass fills the histograms instead
+        jobs = [(inner, outer, height, width, thresholds, morph_radius, min_patch_pixels, ndvi_thresh is not None,
+                 row_area[inner.row_off:inner.row_off + inner.height], step)
+                for inner, outer in iter_tiles(height, width, tile_shape, halo)]
+        fn = _bind(_tile_masks, paths, datasets, bands, workers)
 
+        class_m2 = np.zeros(4)  # per transition class
+        index = PatchIndex()  # loss patches, merged across tile seams
+        timer = StageTimer()  # per-stage seconds summed over tiles
+        with tracer.span("tiles", tiles=len(jobs), workers=workers) as sp:
+            outs = [rasterio.open(os.path.join("outputs", name), "w", **mask_profile(profile, nbits))
+                    for name, nbits in zip(OUTPUT_MASKS, OUTPUT_NBITS)]
+            with ExitStack() as stack, ThreadPoolExecutor(max_workers=1) as writer:
+                for dst in outs:
+                    stack.enter_context(dst)
+                # workers label and measure their tiles; here only small summaries are merged
+                # while a writer thread compresses finished tiles (GDAL releases the GIL)
+                writes: deque = deque()
+                for inner, code, tile in map_tiles(fn, jobs, workers, pool):
+                    timer.merge(tile["stage_s"])
+                    class_m2 += tile["class_m2"]
+                    for h, th in zip(hists, tile["hists"] or ()):
+                        h.merge(th)
+                    index.merge(tile["patches"])
+                    _paste_preview(preview, tile["preview"], inner, step)
+                    writes.append(writer.submit(_write_tile, outs, code, inner))
+                    while len(writes) > max(2, workers):
+                        timer.merge(writes.popleft().result())
+                for w in writes:
+                    timer.merge(w.result())
+            # halo pixels are read more than once; stage seconds are summed over tiles
+            sp.add(bytes_read=sum(o.height * o.width for _, o, *_ in jobs) * _px_bytes(datasets, bands),
+                   stage_s=timer.rounded())
+        with tracer.span("cog") as sp:
+            _finish_cogs()
+            sp.add(bytes_written=_output_bytes())
+
+    report = _make_report(float(row_area.sum()) * width, class_m2, ndvi_thresh, hists)
+    with tracer.span("loss_patches"):
+        report["loss_patches"] = _write_loss_patches(index, min_patch_pixels, profile)
+    with tracer.span("preview"):
+        save_preview_change(preview)
+    report["instrumentation"] = tracer.summary()
+    save_report(report)
     return report
+
+def _write_loss_patches(index: PatchIndex, min_patch_pixels: int, profile) -> int:
+    patches = index.patches(min_patch_pixels)
+    write_patches(os.path.join("outputs", LOSS_PATCHES), patches, profile["transform"], profile["crs"])
+    return len(patches)
+
+def _finish_cogs():
+    # overviews need the whole mask, so they are built once every tile is written;
+    # the four rewrites run side by side (GDAL releases the GIL, and compresses on all cores)
+    with ThreadPoolExecutor(max_workers=len(OUTPUT_MASKS)) as pool:
+        for job in [pool.submit(to_cog, os.path.join("outputs", name), nbits)
+                    for name, nbits in zip(OUTPUT_MASKS, OUTPUT_NBITS)]:
+            job.result()
+
+def _px_bytes(datasets, bands: Tuple[int, int]) -> int:
+    return sum(np.dtype(ds.dtypes[b - 1]).itemsize for ds, b in zip(datasets, bands * 2))
+
+def _input_bytes(datasets, bands: Tuple[int, int]) -> int:
+    return datasets[0].height * datasets[0].width * _px_bytes(datasets, bands)
+
+def _output_bytes() -> int:
+    return sum(os.path.getsize(os.path.join("outputs", f)) for f in OUTPUT_MASKS
+               if os.path.exists(os.path.join("outputs", f)))
+
+def _tile_hist(datasets, bands, window):
+    r0, n0, r1, n1 = datasets
+    timer, hists = StageTimer(), []
+    for red, nir in ((r0, n0), (r1, n1)):
+        with timer("read"):
+            red_px, nir_px = read_pair(red, nir, bands, window)
+        with timer("ndvi"):
+            hists.append(NDVIHistogram().update(compute_ndvi(red_px, nir_px)))
+    return hists[0], hists[1], timer.seconds
+
+def _tile_masks(datasets, bands, inner, outer, height: int, width: int, thresholds: Tuple[float, float],
+                morph_radius: int, min_patch_pixels: int, with_hist: bool, row_area: np.ndarray, step: int):
+    r0, n0, r1, n1 = datasets
+    timer, masks, hists = StageTimer(), [], []
+    for (red, nir), thresh in zip(((r0, n0), (r1, n1)), thresholds):
+        with timer("read"):
+            red_px, nir_px = read_pair(red, nir, bands, outer)
+        if with_hist:
+            with timer("ndvi"):
+                ndvi = compute_ndvi(red_px, nir_px)
+                # halo pixels belong to the neighbouring tiles' histograms
+                hists.append(NDVIHistogram().update(ndvi[inner_slices(inner, outer)]))
+            with timer("threshold"):
+                mask = ndvi > thresh; del ndvi
+        else:
+            with timer("ndvi"):  # the fixed threshold is applied in the fused pass
+                mask, _ = ndvi_forest_mask(red_px, nir_px, thresh)
+        masks.append(clean_tile(mask, inner, outer, height, width, morph_radius, min_patch_pixels, timer))
+    with timer("patch_stats"):
+        code = change_code(*masks)
+        loss = code == LOSS
+        # everything but the code tile itself goes back as a small summary
+        tile = {"class_m2": class_areas(code, row_area), "hists": tuple(hists) or None,
+                "patches": label_tile(loss, inner, row_area)[1],
+                "preview": _preview_tile(loss, inner, step)}
+    tile["stage_s"] = timer.seconds
+    return inner, code, tile
+
+def _write_tile(outs, code: np.ndarray, inner) -> Dict[str, float]:
+    timer = StageTimer()
+    with timer("write"):
+        d0, d1, dc, dm = outs
+        d0.write(code >> 1, 1, window=inner)
+        d1.write(code & 1, 1, window=inner)
+        dc.write((code == LOSS).view(np.uint8), 1, window=inner)
+        dm.write(code, 1, window=inner)
+    return timer.seconds
+
+_READERS: Dict[Tuple[str, ...], tuple] = {}
+
+def _pooled(fn, paths: Tuple[str, ...], bands, *args):
+    # runs in a pool process: keep one set of open handles per process
+    if paths not in _READERS:
+        opened = {p: MappedReader(rasterio.open(p)) for p in dict.fromkeys(paths)}
+        _READERS[paths] = tuple(opened[p] for p in paths)
+    return fn(_READERS[paths], bands, *args)
+
+def _bind(fn, paths: Tuple[str, ...], datasets, bands, workers: int):
+    # worker processes open their own handles; a single worker reuses ours
+    return partial(_pooled, fn, paths, bands) if workers > 1 else partial(fn, datasets, bands)
+
+def _preview_tile(tile: np.ndarray, inner, step: int) -> np.ndarray:
+    # nearest-neighbour decimation onto the global every-`step`-th-pixel grid
+    return tile[-inner.row_off % step::step, -inner.col_off % step::step].view(np.uint8)
+
+def _paste_preview(preview: np.ndarray, sub: np.ndarray, inner, step: int):
+    pr = -(-inner.row_off // step); pc = -(-inner.col_off // step)
+    preview[pr:pr + sub.shape[0], pc:pc + sub.shape[1]] = sub
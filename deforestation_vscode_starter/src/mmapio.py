@@ -0,0 +1,97 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import numpy as np
+from rasterio.windows import Window
+
+def _offset(ds, bidx: int, col: int, row: int, item: str = "OFFSET") -> Optional[int]:
+    v = ds.get_tag_item(f"BLOCK_{item}_{col}_{row}", "TIFF", bidx=bidx)
+    return int(v) if v else None
+
+def mmap_band(ds, bidx: int = 1) -> Optional[np.ndarray]:
+    """Read-only memory map of band `bidx` of an uncompressed GeoTIFF, else None.
+
+    Striped files map to the (height, width) band itself, a zero-copy view. Tiled
+    files map to (tile_rows, tile_cols, block_h, block_w); use `MappedReader` to
+    read windows from them. Every block must sit back to back in row-major order, as
+    GDAL writes them when blocks are written in order, and hold whole samples of the
+    band's dtype (no NBITS packing); anything else returns None.
+    """
+    if ds.driver != "GTiff" or ds.compression is not None:
+        return None
+    if ds.count > 1 and ds.profile.get("interleave") == "pixel":
+        return None  # samples of all bands interleaved
+    try:
+        with open(ds.name, "rb") as f:
+            order = {b"II": "<", b"MM": ">"}.get(f.read(2))
+    except OSError:
+        return None  # not a local file (vsi path, URL ...)
+    if order is None:
+        return None
+    bh, bw = ds.block_shapes[bidx - 1]
+    dtype = np.dtype(ds.dtypes[bidx - 1]).newbyteorder(order)
+    nbits = ds.tags(bidx, ns="IMAGE_STRUCTURE").get("NBITS")
+    if nbits is not None and int(nbits) != dtype.itemsize * 8:
+        return None  # packed samples (e.g. 12-bit in uint16) are not addressable as an array
+    nrows = -(-ds.height // bh); ncols = -(-ds.width // bw)
+    first = _offset(ds, bidx, 0, 0)
+    if first is None:
+        return None
+    block_bytes = bh * bw * dtype.itemsize
+    # every block, not just the ends: windows written out of order keep block 0
+    # first and the last block last but shuffle the ones in between
+    for k in range(nrows * ncols):
+        row, col = divmod(k, ncols)
+        if k and _offset(ds, bidx, col, row) != first + k * block_bytes:
+            return None
+        # libtiff truncates the last strip to the rows left; tiles are always whole
+        rows_in = min(bh, ds.height - row * bh) if bw == ds.width else bh
+        if _offset(ds, bidx, col, row, "SIZE") != rows_in * bw * dtype.itemsize:
+            return None
+    if bw == ds.width:  # strips: the band is one contiguous run of rows
+        return np.memmap(ds.name, dtype=dtype, mode="r", offset=first, shape=(ds.height, ds.width))
+    return np.memmap(ds.name, dtype=dtype, mode="r", offset=first, shape=(nrows, ncols, bh, bw))
+
+class MappedReader:
+    """Drop-in for a rasterio dataset's `read(bidx, window=...)` that slices a memory map.
+
+    Pages come from the OS page cache, so pool processes mapping the same file share
+    them and re-runs skip decoding. Falls back to `ds.read` when the file can't be mapped.
+    """
+    def __init__(self, ds):
+        self.ds = ds
+        self._maps: Dict[int, Optional[np.ndarray]] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.ds, name)
+
+    def _map(self, bidx: int) -> Optional[np.ndarray]:
+        if bidx not in self._maps:
+            self._maps[bidx] = mmap_band(self.ds, bidx)
+        return self._maps[bidx]
+
+    def is_mapped(self, bidx: int) -> bool:
+        return self._map(bidx) is not None
+
+    def read(self, bidx: int | List[int] = 1, window: Window | None = None, **kwargs) -> np.ndarray:
+        if isinstance(bidx, (list, tuple)):
+            if kwargs or not all(self.is_mapped(b) for b in bidx):
+                return self.ds.read(list(bidx), window=window, **kwargs)
+            return np.stack([self.read(b, window=window) for b in bidx])
+        m = self._map(bidx) if not kwargs else None
+        if m is None:
+            return self.ds.read(bidx, window=window, **kwargs)
+        window = window or Window(0, 0, self.ds.width, self.ds.height)
+        r0, c0 = int(window.row_off), int(window.col_off)
+        r1, c1 = r0 + int(window.height), c0 + int(window.width)
+        if m.ndim == 2:
+            return m[r0:r1, c0:c1]
+        # tiled: copy the covered parts of each block (no decompression involved)
+        _, _, bh, bw = m.shape
+        out = np.empty((r1 - r0, c1 - c0), dtype=m.dtype)
+        for ty in range(r0 // bh, (r1 - 1) // bh + 1):
+            for tx in range(c0 // bw, (c1 - 1) // bw + 1):
+                br0 = max(r0, ty * bh); br1 = min(r1, (ty + 1) * bh)
+                bc0 = max(c0, tx * bw); bc1 = min(c1, (tx + 1) * bw)
+                out[br0 - r0:br1 - r0, bc0 - c0:bc1 - c0] = \
+                    m[ty, tx, br0 - ty * bh:br1 - ty * bh, bc0 - tx * bw:bc1 - tx * bw]
+        return out
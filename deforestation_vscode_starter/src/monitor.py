@@ -0,0 +1,164 @@
+from __future__ import annotations
+import csv, datetime as dt, json, os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np, rasterio
+
+from . import gee_pipeline, local_pipeline
+from .area import class_areas, row_areas
+from .cog import mask_profile, to_cog
+from .instrument import Tracer
+from .utils import transition_areas
+
+MONITOR_FIELDS = ["region", "period", "start", "end", "forest_area_ha", "forest_loss_ha", "forest_gain_ha",
+                  "net_change_ha", "ndvi_mean", "ndvi_threshold_used", "data_source"]
+
+class MonitorStore:
+    """Per-AOI time-series state under <root>/<aoi_id>/.
+
+    state.json holds one record per period in arrival order; local runs also keep
+    mask_<period>.tif and change_<period>.tif. summary.csv is append-only, one row
+    per period, so the history is never recomputed or rewritten.
+    """
+    def __init__(self, root: str, aoi_id: str):
+        self.aoi_id = aoi_id; self.dir = os.path.join(root, aoi_id)
+        os.makedirs(self.dir, exist_ok=True)
+        self.state_path = os.path.join(self.dir, "state.json")
+        self.summary_path = os.path.join(self.dir, "summary.csv")
+        self.periods: List[Dict[str, Any]] = []
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.periods = json.load(f)["periods"]
+            self._sync_summary()
+
+    @property
+    def last(self) -> Optional[Dict[str, Any]]:
+        return self.periods[-1] if self.periods else None
+
+    def get(self, period: str) -> Optional[Dict[str, Any]]:
+        return next((p for p in self.periods if p["period"] == period), None)
+
+    def path(self, kind: str, period: str) -> str:
+        return os.path.join(self.dir, f"{kind}_{period}.tif")
+
+    def record(self, rec: Dict[str, Any]):
+        """Append one period: state.json first (atomically) to commit it, then its summary row."""
+        self.periods.append(rec)
+        with open(self.state_path + ".part", "w") as f:
+            json.dump({"aoi_id": self.aoi_id, "periods": self.periods}, f, indent=2)
+        os.replace(self.state_path + ".part", self.state_path)
+        self._sync_summary()
+
+    def _sync_summary(self):
+        # append the committed periods summary.csv lacks (a crash after the state write)
+        written = set()
+        if os.path.exists(self.summary_path):
+            with open(self.summary_path, newline="") as f:
+                written = {row["period"] for row in csv.DictReader(f)}
+        missing = [p for p in self.periods if p["period"] not in written]
+        if not missing:
+            return
+        new_file = not os.path.exists(self.summary_path)
+        with open(self.summary_path, "a", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=MONITOR_FIELDS)
+            if new_file:
+                w.writeheader()
+            w.writerows({k: p.get(k) for k in MONITOR_FIELDS} for p in missing)
+
+def _change_fields(class_ha) -> Dict[str, float]:
+    areas = transition_areas(class_ha)
+    return {k: round(areas[k], 2) for k in ("forest_loss_ha", "forest_gain_ha", "net_change_ha")}
+
+def step_local(store: MonitorStore, period: str, red: str, nir: str, ndvi_thresh: float | None,
+               min_patch_pixels: int, morph_radius: int, tracer: Tracer | None = None,
+               red_band: int = 1, nir_band: int = 1) -> Dict[str, Any]:
+    """Add `period` from red/NIR rasters (or two bands of one stack): one mask, diffed
+    against the last stored mask only."""
+    if store.get(period):
+        print(f"⚡ {store.aoi_id}/{period} already in the store.")
+        return store.get(period)
+    local_pipeline.check_bands(red, nir, red_band, nir_band)
+    tracer = tracer or Tracer()
+    with tracer.span("read"):
+        with local_pipeline.open_inputs((red, nir)) as (red_ds, nir_ds):
+            r, n = local_pipeline.read_pair(red_ds, nir_ds, (red_band, nir_band))
+            profile, row_area = red_ds.profile, row_areas(red_ds.crs, red_ds.transform, red_ds.height)
+    with tracer.span("mask"):
+        mask, hist = local_pipeline.period_mask(r, n, ndvi_thresh, min_patch_pixels, morph_radius)
+        del r, n
+    rec = {"region": store.aoi_id, "period": period, "start": period, "end": period,
+           "forest_area_ha": round(float(class_areas(mask.view(np.uint8), row_area, 2)[1]) / 10000.0, 2),
+           "ndvi_mean": round(hist.mean(), 4),
+           "ndvi_threshold_used": ndvi_thresh if ndvi_thresh is not None else "Otsu", "data_source": "local"}
+    prev = store.last
+    with tracer.span("change", previous=prev["period"] if prev else None):
+        if prev:
+            with rasterio.open(store.path("mask", prev["period"])) as src:
+                prev_mask = src.read(1).view(bool)
+            if prev_mask.shape != mask.shape:
+                raise ValueError(f"{period} is not on the grid of {prev['period']}")
+            code = local_pipeline.change_code(prev_mask, mask)
+            rec.update(_change_fields(class_areas(code, row_area) / 10000.0))
+            _write_cog(store.path("change", period), code, profile, nbits=2)
+        _write_cog(store.path("mask", period), mask.view(np.uint8), profile, nbits=1)
+    store.record(rec)
+    return rec
+
+def _write_cog(path: str, arr: np.ndarray, profile, nbits: int):
+    with rasterio.open(path, "w", **mask_profile(profile, nbits)) as dst:
+        dst.write(arr, 1)
+    to_cog(path, nbits)
+
+def period_window(period: str) -> Tuple[str, str]:
+    """Earth Engine date window (end exclusive, as in filterDate) a PERIOD label stands for:
+    YYYY is that year, YYYY-MM that month, START/END (ISO dates) an explicit window."""
+    if "/" in period:
+        start, end = (dt.date.fromisoformat(d) for d in period.split("/", 1))
+    elif len(period) == 4 and period.isdigit():
+        start = dt.date(int(period), 1, 1); end = dt.date(start.year + 1, 1, 1)
+    else:
+        try:
+            start = dt.datetime.strptime(period, "%Y-%m").date()
+        except ValueError:
+            raise ValueError(f"Monitoring period {period!r} is not YYYY, YYYY-MM or START/END") from None
+        end = dt.date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    if end <= start:
+        raise ValueError(f"Monitoring period {period!r} ends before it starts")
+    return start.isoformat(), end.isoformat()
+
+def step_gee(store: MonitorStore, period: str, window: Tuple[str, str], geometry, ndvi_thresh: float,
+             cloud_prob: int, tracer: Tracer | None = None, client=None) -> Dict[str, Any]:
+    """Add `period` (date window) via Earth Engine: forest area plus transitions against the
+    last stored period, in one getInfo. Stats only; the previous composite is rebuilt
+    server-side from its stored window, never the rest of the history. The window must
+    start no earlier than the last stored one ends."""
+    if store.get(period):
+        print(f"⚡ {store.aoi_id}/{period} already in the store.")
+        return store.get(period)
+    prev = store.last
+    if prev and window[0] < prev["end"]:
+        raise ValueError(f"{period} ({window[0]}–{window[1]}) does not come after "
+                         f"{prev['period']} ({prev['start']}–{prev['end']})")
+    ee = gee_pipeline.ee
+    tracer = tracer or Tracer()
+    client = client or gee_pipeline.EEClient()
+    with tracer.span("init_ee"):
+        client.initialize()
+    region = ee.Geometry(geometry)
+    ndvi, meta = gee_pipeline.get_s2_ndvi(window[0], window[1], region, cloud_prob)
+    mask = gee_pipeline.forest_mask(ndvi, ndvi_thresh)
+    query = {"meta": meta, "forest_ha": gee_pipeline.area_ha(mask, region)}
+    if prev:
+        prev_ndvi, _ = gee_pipeline.get_s2_ndvi(prev["start"], prev["end"], region, prev["cloud_prob"])
+        prev_mask = gee_pipeline.forest_mask(prev_ndvi, prev["ndvi_threshold_used"])
+        query["transitions"] = gee_pipeline.transition_ha(gee_pipeline.change_image(prev_mask, mask), region)
+    with tracer.span("fetch_stats", previous=prev["period"] if prev else None):
+        info = gee_pipeline.with_retry(client.get_info, ee.Dictionary(query))
+    gee_pipeline._log_source(window[0], window[1], info["meta"])
+    rec = {"region": store.aoi_id, "period": period, "start": window[0], "end": window[1],
+           "forest_area_ha": round(info["forest_ha"] or 0, 2), "ndvi_threshold_used": ndvi_thresh,
+           "cloud_prob": cloud_prob, "data_source": info["meta"]["source"]}
+    if prev:
+        rec.update(_change_fields(gee_pipeline._class_ha(info["transitions"])))
+    store.record(rec)
+    return rec
@@ -0,0 +1,70 @@
+from __future__ import annotations
+import hashlib, json, os, tempfile
+from typing import Sequence, Tuple, Union
+import numpy as np, rasterio
+from matplotlib import colormaps
+from matplotlib.colors import LinearSegmentedColormap
+from PIL import Image
+from rasterio.coords import BoundingBox
+from rasterio.enums import Resampling
+
+RENDER_MAX_PX = 1024
+RENDER_CACHE_DIR = os.path.join(tempfile.gettempdir(), "deforestation_render")
+
+Palette = Union[str, Sequence[str]]
+
+def palette_lut(palette: Palette = "RdYlGn", n: int = 256) -> np.ndarray:
+    """(n, 3) uint8 colour table from a matplotlib colormap name or a list of colours."""
+    cmap = colormaps[palette] if isinstance(palette, str) else LinearSegmentedColormap.from_list("p", list(palette))
+    return np.round(cmap(np.linspace(0, 1, n))[:, :3] * 255).astype(np.uint8)
+
+def read_decimated(path: str, max_px: int = RENDER_MAX_PX, band: int = 1
+                   ) -> Tuple[np.ma.MaskedArray, BoundingBox, float]:
+    """Band `band` read at most `max_px` on its long side, plus bounds and source pixels per sample.
+
+    A smaller `out_shape` with nearest resampling lets GDAL serve the read from the
+    closest internal overview, so the full-resolution raster is never decoded.
+    """
+    with rasterio.open(path) as src:
+        step = max(1.0, max(src.height, src.width) / max_px)
+        shape = (max(1, round(src.height / step)), max(1, round(src.width / step)))
+        arr = src.read(band, out_shape=shape, resampling=Resampling.nearest, masked=True)
+        factor = src.height * src.width / arr.size
+        return arr, src.bounds, factor
+
+def colorize(arr: np.ma.MaskedArray, lut: np.ndarray, vmin: float | None = None,
+             vmax: float | None = None) -> np.ndarray:
+    """RGBA uint8 image: values stretched onto `lut` (min-max unless `vmin`/`vmax` are given),
+    masked / NaN pixels transparent."""
+    data = np.ma.masked_invalid(arr.astype(np.float32, copy=False))
+    rgba = np.zeros(data.shape + (4,), dtype=np.uint8)
+    if data.count() == 0:
+        return rgba
+    lo = float(data.min()) if vmin is None else vmin
+    hi = float(data.max()) if vmax is None else vmax
+    idx = np.ma.filled((data - lo) * ((len(lut) - 1) / (hi - lo + 1e-9)), 0)
+    np.clip(idx, 0, len(lut) - 1, out=idx)
+    rgba[..., :3] = lut[idx.astype(np.intp)]
+    rgba[..., 3] = np.where(np.ma.getmaskarray(data), 0, 255)
+    return rgba
+
+def render_png(path: str, palette: Palette = "RdYlGn", max_px: int = RENDER_MAX_PX,
+               cache_dir: str = RENDER_CACHE_DIR) -> Tuple[str, BoundingBox]:
+    """PNG preview of a raster plus its bounds, cached per (file, mtime, size, palette, max_px)."""
+    st = os.stat(path)
+    with rasterio.open(path) as src:
+        bounds = src.bounds
+    blob = json.dumps([os.path.abspath(path), st.st_mtime_ns, st.st_size, palette, max_px], default=list)
+    png = os.path.join(cache_dir, hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32] + ".png")
+    if not os.path.exists(png):
+        arr, _, _ = read_decimated(path, max_px)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".part")
+        os.close(fd)
+        try:
+            Image.fromarray(colorize(arr, palette_lut(palette))).save(tmp, format="PNG")
+            os.replace(tmp, png)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return png, bounds
@@ -0,0 +1,209 @@
+"""In-process XYZ tile endpoint for the dashboard's output rasters.
+
+    url = get_server().register("outputs/forest_mask_past.tif", palette=["red", "yellow", "green"])
+    folium.TileLayer(tiles=url, attr="local", overlay=True).add_to(m)
+
+Tiles are 256 px Web-Mercator PNG (or .webp) rendered on demand from the COGs
+through a WarpedVRT, so each request decodes only the overview level it shows.
+Rendering runs on a fixed pool of threads that each keep their datasets open, as
+the HTTP server itself starts a new thread per connection.
+
+The server binds TILE_HOST:TILE_PORT (default 127.0.0.1, any free port). For a
+shared deployment bind 0.0.0.0 and/or set TILE_PUBLIC_URL to the address browsers
+reach it at (e.g. a reverse-proxy path such as https://host/tiles).
+"""
+from __future__ import annotations
+import hashlib, io, math, os, socket, threading, urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import numpy as np, rasterio
+from PIL import Image
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.transform import from_bounds
+from rasterio.warp import transform_bounds
+
+# Works both as `src.tileserver` and as a top-level module (Streamlit app)
+try:
+    from .render import Palette, palette_lut, colorize, read_decimated
+except ImportError:
+    from render import Palette, palette_lut, colorize, read_decimated
+
+TILE_PX = 256
+TILE_CACHE_SIZE = 1024  # rendered tiles kept in memory
+RENDER_THREADS = os.cpu_count() or 1
+HANDLES_PER_THREAD = 8  # open datasets kept by each render thread
+MAX_AGE_S = 3600
+TILE_FORMATS = {"png": "PNG", "webp": "WEBP"}
+WEB_MERCATOR = "EPSG:3857"
+_HALF = math.pi * 6378137.0  # half the Web-Mercator world width in metres
+TILE_HOST = os.environ.get("TILE_HOST", "127.0.0.1")
+TILE_PORT = int(os.environ.get("TILE_PORT", "0"))
+TILE_PUBLIC_URL = os.environ.get("TILE_PUBLIC_URL") or None
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(left, bottom, right, top) of XYZ tile z/x/y in EPSG:3857 metres."""
+    size = 2 * _HALF / (1 << z)
+    left = -_HALF + x * size; top = _HALF - y * size
+    return left, top - size, left + size, top
+
+class _Layer:
+    def __init__(self, path: str, palette: Palette, vmin: float | None, vmax: float | None):
+        self.path = path; self.lut = palette_lut(palette)
+        self.mtime = os.stat(path).st_mtime_ns
+        with rasterio.open(path) as src:
+            self.bounds = transform_bounds(src.crs, WEB_MERCATOR, *src.bounds)
+        if vmin is None or vmax is None:
+            # fix the stretch once per layer so neighbouring tiles match
+            arr, _, _ = read_decimated(path)
+            vmin = float(arr.min()) if vmin is None else vmin
+            vmax = float(arr.max()) if vmax is None else vmax
+        self.vmin, self.vmax = vmin, vmax
+
+class TileServer:
+    """Threaded HTTP server on `host`:`port` serving /<layer>/<z>/<x>/<y>.png|.webp.
+
+    Tile urls start with `public_url` (default http://<host>:<port>, the machine's
+    name when bound to all interfaces). Rendered tiles are kept in an LRU of
+    `cache_size` entries and sent with Cache-Control / ETag headers, so the browser
+    revalidates with a 304 instead of re-downloading. Tiles render on
+    `render_threads` long-lived threads.
+    """
+    def __init__(self, host: str = TILE_HOST, port: int = TILE_PORT, public_url: str | None = TILE_PUBLIC_URL,
+                 cache_size: int = TILE_CACHE_SIZE, render_threads: int = RENDER_THREADS):
+        self.layers: Dict[str, _Layer] = {}
+        self.cache_size = cache_size
+        self._tiles: OrderedDict[tuple, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        # GDAL handles are not thread-safe, so each render thread opens its own; the
+        # renderers outlive the per-connection request threads, so the handles are reused
+        self._local = threading.local()
+        self._renderers = ThreadPoolExecutor(max_workers=render_threads, thread_name_prefix="tile-render")
+        self.httpd = ThreadingHTTPServer((host, port), _handler(self))
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        if public_url is None:
+            name = socket.getfqdn() if host in ("", "0.0.0.0", "::") else host
+            public_url = f"http://{name}:{self.port}"
+        self.public_url = public_url.rstrip("/")
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def register(self, path: str, palette: Palette = "RdYlGn", vmin: float | None = None,
+                 vmax: float | None = None, fmt: str = "png") -> str:
+        """Serve `path` and return its XYZ url template."""
+        layer = _Layer(os.path.abspath(path), palette, vmin, vmax)
+        name = hashlib.sha256(repr((layer.path, layer.mtime, palette, vmin, vmax)).encode()).hexdigest()[:16]
+        with self._lock:
+            self.layers[name] = layer
+        return f"{self.public_url}/{name}/{{z}}/{{x}}/{{y}}.{fmt}"
+
+    @property
+    def local_only(self) -> bool:
+        """True when tile urls point at this machine's loopback address."""
+        return urlsplit(self.public_url).hostname in LOOPBACK_HOSTS
+
+    def reachable(self, timeout: float = 2.0) -> bool:
+        """Whether `public_url` answers (a misconfigured proxy or firewall shows up here)."""
+        try:
+            with urllib.request.urlopen(self.public_url + "/health", timeout=timeout) as resp:
+                return resp.status == 200
+        except OSError:
+            return False
+
+    def tile(self, name: str, z: int, x: int, y: int, fmt: str = "png") -> Optional[bytes]:
+        layer = self.layers.get(name)
+        if layer is None or fmt not in TILE_FORMATS or not 0 <= x < (1 << z) or not 0 <= y < (1 << z):
+            return None
+        key = (name, layer.mtime, z, x, y, fmt)
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+        data = self._renderers.submit(lambda: _encode(self._render(layer, z, x, y), fmt)).result()
+        with self._lock:
+            self._tiles[key] = data
+            while len(self._tiles) > self.cache_size:
+                self._tiles.popitem(last=False)
+        return data
+
+    def _render(self, layer: _Layer, z: int, x: int, y: int) -> np.ndarray:
+        left, bottom, right, top = tile_bounds(z, x, y)
+        lb = layer.bounds
+        if right <= lb[0] or left >= lb[2] or top <= lb[1] or bottom >= lb[3]:
+            return np.zeros((TILE_PX, TILE_PX, 4), dtype=np.uint8)
+        # a warp straight onto the tile grid; GDAL picks the overview matching its resolution.
+        # The added alpha band is 0 outside the raster, which would otherwise read back as 0.
+        with WarpedVRT(self._dataset(layer), crs=WEB_MERCATOR, width=TILE_PX, height=TILE_PX,
+                       transform=from_bounds(left, bottom, right, top, TILE_PX, TILE_PX),
+                       resampling=Resampling.nearest, add_alpha=True) as vrt:
+            arr = vrt.read(1, masked=True)
+            arr.mask = np.ma.getmaskarray(arr) | (vrt.read(vrt.count) == 0)
+        return colorize(arr, layer.lut, layer.vmin, layer.vmax)
+
+    def _dataset(self, layer: _Layer):
+        """This render thread's handle on `layer`, from a small per-thread LRU."""
+        handles = self._local.__dict__.setdefault("handles", OrderedDict())
+        key = (layer.path, layer.mtime)
+        if key in handles:
+            handles.move_to_end(key)
+        else:
+            handles[key] = rasterio.open(layer.path)
+            while len(handles) > HANDLES_PER_THREAD:
+                handles.popitem(last=False)[1].close()
+        return handles[key]
+
+    def close(self):
+        self.httpd.shutdown(); self.httpd.server_close()
+        self._renderers.shutdown()
+
+def _encode(rgba: np.ndarray, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(rgba).save(buf, format=TILE_FORMATS[fmt])
+    return buf.getvalue()
+
+def _handler(server: TileServer):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0].rstrip("/").endswith("/health"):
+                self.send_response(200)
+                self.send_header("Content-Length", "2"); self.end_headers()
+                self.wfile.write(b"ok"); return
+            try:
+                name, z, x, rest = self.path.split("?")[0].strip("/").split("/")[-4:]
+                y, fmt = rest.split(".")
+                data = server.tile(name, int(z), int(x), int(y), fmt)
+            except ValueError:
+                data = None
+            if data is None:
+                self.send_error(404); return
+            etag = '"' + hashlib.md5(data).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag); self.end_headers(); return
+            self.send_response(200)
+            self.send_header("Content-Type", f"image/{fmt}")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Cache-Control", f"public, max-age={MAX_AGE_S}")
+            self.send_header("ETag", etag)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+_server: TileServer | None = None
+_server_lock = threading.Lock()
+
+def get_server() -> TileServer:
+    """Process-wide server, started on first use (Streamlit reruns reuse it)."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = TileServer()
+        return _server
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import ExitStack
+from rasterio.windows import Window
+from scipy import ndimage as ndi
+from typing import Any, Callable, Iterable, Iterator, Tuple
+
+# Works both as `src.tiling` and as a top-level module (Streamlit app)
+try:
+    from .instrument import StageTimer
+    from .patches import CONNECTIVITY, close_disk
+except ImportError:
+    from instrument import StageTimer
+    from patches import CONNECTIVITY, close_disk
+
+def tile_shape_for(ds, target: int = 1024) -> Tuple[int, int]:
+    """Tile shape made of whole internal blocks (striped files get `target`-wide tiles)."""
+    bh, bw = ds.block_shapes[0]
+    th = (target // bh) * bh if bh <= target else target
+    tw = (target // bw) * bw if bw <= target else target
+    return min(th, ds.height), min(tw, ds.width)
+
+def halo_for(morph_radius: int, min_patch_pixels: int) -> int:
+    # closing needs 2r of context; a patch reaching `min_patch_pixels` past the
+    # tile edge is at least that big, so it can be kept without seeing all of it
+    return 2 * max(morph_radius, 0) + max(min_patch_pixels, 0)
+
+def iter_tiles(height: int, width: int, tile_shape: Tuple[int, int],
+               halo: int = 0) -> Iterator[Tuple[Window, Window]]:
+    """Yield (inner, outer) windows; outer is inner grown by `halo`, clipped to the scene."""
+    th, tw = tile_shape
+    for row in range(0, height, th):
+        for col in range(0, width, tw):
+            h = min(th, height - row); w = min(tw, width - col)
+            r0 = max(row - halo, 0); c0 = max(col - halo, 0)
+            r1 = min(row + h + halo, height); c1 = min(col + w + halo, width)
+            yield Window(col, row, w, h), Window(c0, r0, c1 - c0, r1 - r0)
+
+def inner_slices(inner: Window, outer: Window) -> Tuple[slice, slice]:
+    r = inner.row_off - outer.row_off; c = inner.col_off - outer.col_off
+    return slice(r, r + inner.height), slice(c, c + inner.width)
+
+def clean_tile(mask: np.ndarray, inner: Window, outer: Window, height: int, width: int,
+               morph_radius: int, min_patch_pixels: int, timer: StageTimer | None = None) -> np.ndarray:
+    """Closing + small-patch removal on a haloed tile, cropped to `inner`.
+
+    Matches the whole-scene `close_disk` / `remove_small_patches` result as long
+    as the halo is at least `halo_for(morph_radius, min_patch_pixels)`. `timer`
+    collects "closing" and "small_objects" seconds.
+    """
+    timer = timer or StageTimer()
+    # interior edges (not on the scene border) lose 2r of valid closing output
+    top = outer.row_off > 0; left = outer.col_off > 0
+    bottom = outer.row_off + outer.height < height; right = outer.col_off + outer.width < width
+    if morph_radius > 0:
+        with timer("closing"):
+            mask = close_disk(mask, morph_radius)
+        m = 2 * morph_radius
+        mask = mask[m if top else 0: mask.shape[0] - (m if bottom else 0),
+                    m if left else 0: mask.shape[1] - (m if right else 0)]
+        outer = Window(outer.col_off + (m if left else 0), outer.row_off + (m if top else 0),
+                       mask.shape[1], mask.shape[0])
+    if min_patch_pixels > 0:
+        with timer("small_objects"):
+            labels, n = ndi.label(mask, CONNECTIVITY)
+            # patches running off an interior edge are longer than min_patch_pixels
+            on_edge = np.zeros(n + 1, dtype=bool)
+            for edge, cut in ((top, labels[0]), (bottom, labels[-1]),
+                              (left, labels[:, 0]), (right, labels[:, -1])):
+                if edge:
+                    on_edge[cut] = True
+            keep = on_edge | (np.bincount(labels.ravel(), minlength=n + 1) >= min_patch_pixels)
+            keep[0] = False
+            mask = keep[labels]
+    return mask[inner_slices(inner, outer)]
+
+def map_tiles(fn: Callable[..., Any], jobs: Iterable[tuple], workers: int = 1,
+              pool: ProcessPoolExecutor | None = None) -> Iterator[Any]:
+    """Yield fn(*job) for each job, on `workers` processes in completion order.
+
+    At most 2 * workers jobs are in flight so finished tiles never pile up in memory.
+    Pass `pool` to reuse one set of worker processes across several passes (starting
+    them is costly where processes are spawned, not forked).
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield fn(*job)
+        return
+    with ExitStack() as stack:
+        if pool is None:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+        pending = set()
+        for job in jobs:
+            pending.add(pool.submit(fn, *job))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield fut.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
@@ -1,7 +1,7 @@
 from __future__ import annotations
-import json, os
+import json, os, re
 from dataclasses import dataclass
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Iterator, Optional, Tuple
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -13,7 +13,12 @@ def save_report(report: Dict[str, Any]):
     ensure_dirs()
     with open("outputs/report.json", "w") as f:
         json.dump(report, f, indent=2)
-    row = { 
+    df = pd.DataFrame([report_row(report)])
+    df.to_csv("outputs/summary.csv", index=False)
+
+def report_row(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Flat summary.csv row for a report."""
+    return { 
         "region": report.get("region", "AOI"),
         "t0_start": report["past_window"][0],
         "t0_end": report["past_window"][1],
@@ -26,8 +31,21 @@ def save_report(report: Dict[str, Any]):
         "deforestation_percent": report["deforestation_percent"],
         "ndvi_threshold_used": report["ndvi_threshold_used"],
     }
-    df = pd.DataFrame([row])
-    df.to_csv("outputs/summary.csv", index=False)
+
+# change code = past * 2 + present
+TRANSITION_CLASSES = ("stable_nonforest", "gain", "loss", "stable_forest")
+
+def transition_areas(class_ha) -> Dict[str, float]:
+    """Forest areas (ha) from per-transition-class areas indexed by change code."""
+    nonforest, gain, loss, stable = (float(class_ha[i]) for i in range(4))
+    return {
+        "forest_area_past_ha": stable + loss,
+        "forest_area_present_ha": stable + gain,
+        "forest_loss_ha": loss,
+        "forest_gain_ha": gain,
+        "net_change_ha": gain - loss,
+        "stable_forest_ha": stable,
+    }
 
 def percent_from_areas(area_past_ha: float, area_present_ha: float) -> Tuple[float,float]:
     if area_past_ha <= 0:
@@ -45,3 +63,38 @@ def save_preview_change(mask_loss: np.ndarray, title: str = "Deforestation (t0
     plt.axis("off")
     plt.savefig("outputs/preview_change.png", bbox_inches="tight", dpi=150)
     plt.close()
+
+ID_PROPERTIES = ("id", "ID", "name", "NAME", "district", "DISTRICT")
+
+def _safe_id(value: Any) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", str(value)).strip("_") or "feature"
+
+def iter_features(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (feature_id, geometry) for every feature of a GeoJSON file or a directory of them.
+
+    Plain json parsing: no geopandas import per AOI. Ids come from the first of
+    ID_PROPERTIES present, else the file name / feature index.
+    """
+    files = ([os.path.join(path, f) for f in sorted(os.listdir(path))
+              if f.lower().endswith((".geojson", ".json"))] if os.path.isdir(path) else [path])
+    seen = set()
+    for file in files:
+        with open(file) as f:
+            doc = json.load(f)
+        if doc.get("type") == "FeatureCollection":
+            features = doc["features"]
+        elif doc.get("type") == "Feature":
+            features = [doc]
+        else:
+            features = [{"type": "Feature", "properties": {}, "geometry": doc}]
+        stem = os.path.splitext(os.path.basename(file))[0]
+        for i, feat in enumerate(features):
+            props = feat.get("properties") or {}
+            raw = next((props[k] for k in ID_PROPERTIES if props.get(k) not in (None, "")), None)
+            if raw is None:
+                raw = stem if len(features) == 1 and len(files) > 1 else f"{stem}_{i:04d}"
+            fid = _safe_id(raw)
+            if fid in seen:
+                fid = f"{fid}_{i:04d}"
+            seen.add(fid)
+            yield fid, feat["geometry"]
@@ -0,0 +1,149 @@
+"""Loss patches as polygons, streamed to GeoJSON or GeoPackage.
+
+    python -m src.cli --mode local ... --vectorize outputs/loss_patches.gpkg
+
+The change map is polygonized tile by tile with `rasterio.features.shapes`. Patches
+inside one tile are written straight away; patches crossing a tile seam are merged
+with `PatchIndex` and polygonized once more over their own bounding box, so no
+geometry union is needed and memory stays at a tile plus the largest patch.
+Polygons are simplified with shapely (topology-preserving) and streamed out
+through fiona.
+"""
+from __future__ import annotations
+import os
+from typing import Any, Dict, Iterator, Tuple
+import fiona, numpy as np, rasterio, shapely
+from rasterio.crs import CRS
+from rasterio.features import shapes
+from rasterio.warp import transform_geom
+from rasterio.windows import Window, transform as window_transform
+from scipy import ndimage as ndi
+from shapely.geometry import mapping, shape
+from .area import row_areas
+from .instrument import Tracer
+from .local_pipeline import LOSS
+from .patches import CONNECTIVITY, PatchIndex
+from .tiling import iter_tiles, tile_shape_for
+
+VECTOR_TILE_PX = 2048
+SIMPLIFY_PX = 1.0  # Douglas-Peucker tolerance, in pixels
+VECTOR_FIELDS = {"patch_id": "int", "pixels": "int", "area_ha": "float"}
+GEOJSON_CRS = "EPSG:4326"  # RFC 7946
+
+def _simplified(geom: Dict[str, Any], tol: float) -> Dict[str, Any]:
+    # preserve_topology keeps holes inside their shell, so the polygon stays valid
+    if tol <= 0:
+        return geom
+    return mapping(shapely.simplify(shape(geom), tol, preserve_topology=True))
+
+def _label_areas(labels: np.ndarray, sizes: np.ndarray, row_area: np.ndarray) -> np.ndarray:
+    if np.all(row_area == row_area[0]):
+        return sizes * row_area[0]
+    return np.bincount(labels.ravel(), np.repeat(row_area, labels.shape[1]), minlength=len(sizes))
+
+def loss_polygons(src, value: int = LOSS, min_patch_pixels: int = 0, simplify_px: float = SIMPLIFY_PX,
+                  tile_px: int = VECTOR_TILE_PX) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Yield (polygon in `src`'s CRS, properties) for every 4-connected patch of
+    pixels equal to `value` with at least `min_patch_pixels` pixels."""
+    height, width = src.height, src.width
+    row_area = row_areas(src.crs, src.transform, src.height)
+    tol = simplify_px * abs(src.transform.a)
+    index = PatchIndex()
+    seeds: Dict[int, Tuple[int, int]] = {}  # seam-crossing label -> one of its pixels
+    n = 0
+    for win, _ in iter_tiles(height, width, tile_shape_for(src, tile_px)):
+        r0, c0, h, w = int(win.row_off), int(win.col_off), int(win.height), int(win.width)
+        labels, base = index.add(src.read(1, window=win) == value, win, row_area)
+        rows = np.arange(r0, r0 + h); cols = np.arange(c0, c0 + w)
+        seam = np.zeros(labels.max() + 1, dtype=bool)
+        for inside, edge, er, ec in ((r0 > 0, labels[0], np.full(w, r0), cols),
+                                     (r0 + h < height, labels[-1], np.full(w, r0 + h - 1), cols),
+                                     (c0 > 0, labels[:, 0], rows, np.full(h, c0)),
+                                     (c0 + w < width, labels[:, -1], rows, np.full(h, c0 + w - 1))):
+            if inside:
+                seam[edge] = True
+                for lab, i in zip(*np.unique(edge, return_index=True)):
+                    if lab:
+                        seeds.setdefault(int(lab) + base, (int(er[i]), int(ec[i])))
+        seam[0] = True
+        sizes = np.bincount(labels.ravel(), minlength=len(seam))
+        done = ~seam & (sizes >= min_patch_pixels)
+        if done.any():
+            area = _label_areas(labels, sizes, row_area[r0:r0 + h])
+            for geom, lab in shapes(labels, mask=done[labels], connectivity=4,
+                                    transform=window_transform(win, src.transform)):
+                lab = int(lab); n += 1
+                yield _simplified(geom, tol), {"patch_id": n, "pixels": int(sizes[lab]),
+                                               "area_ha": round(area[lab] / 10000.0, 4)}
+    # seam-crossing patches, merged: polygonize each on its bbox window
+    roots = index.roots()
+    first = {}
+    for lab, seed in seeds.items():
+        first.setdefault(int(roots[lab]), seed)
+    for p in index.patches(min_patch_pixels):
+        seed = first.get(p["id"])
+        if seed is None:
+            continue
+        win = Window(p["col_min"], p["row_min"], p["col_max"] - p["col_min"], p["row_max"] - p["row_min"])
+        labels, _ = ndi.label(src.read(1, window=win) == value, CONNECTIVITY)
+        mine = labels == labels[seed[0] - p["row_min"], seed[1] - p["col_min"]]
+        for geom, _ in shapes(mine.view(np.uint8), mask=mine, connectivity=4,
+                              transform=window_transform(win, src.transform)):
+            n += 1
+            yield _simplified(geom, tol), {"patch_id": n, "pixels": p["pixels"],
+                                           "area_ha": round(p["area_m2"] / 10000.0, 4)}
+
+VECTOR_DRIVERS = {".geojson": "GeoJSON", ".json": "GeoJSON", ".gpkg": "GPKG"}
+
+class VectorWriter:
+    """One polygon layer streamed feature by feature through fiona into `<path>.part`;
+    `close()` publishes it under `path`, `abort()` deletes it. GeoJSON is written in
+    lon/lat (RFC 7946), GeoPackage in the raster's CRS."""
+    def __init__(self, path: str, crs, layer: str = "loss_patches"):
+        self.path, self.part = path, path + ".part"
+        driver = VECTOR_DRIVERS[os.path.splitext(path)[1].lower()]
+        self.reproject = driver == "GeoJSON" and crs is not None and not crs.is_geographic
+        self.crs = crs
+        out_crs = CRS.from_string(GEOJSON_CRS) if driver == "GeoJSON" else crs
+        if os.path.exists(self.part):
+            os.remove(self.part)
+        schema = {"geometry": "Polygon", "properties": VECTOR_FIELDS}
+        kwargs = {"layer": layer} if driver == "GPKG" else {}
+        self.dst = fiona.open(self.part, "w", driver=driver, schema=schema,
+                              crs=out_crs.to_wkt() if out_crs is not None else None, **kwargs)
+
+    def write(self, geom: Dict[str, Any], props: Dict[str, Any]):
+        if self.reproject:
+            geom = transform_geom(self.crs, GEOJSON_CRS, geom)
+        self.dst.write({"geometry": geom, "properties": props})
+
+    def close(self):
+        self.dst.close()
+        os.replace(self.part, self.path)
+
+    def abort(self):
+        self.dst.close()
+        if os.path.exists(self.part):
+            os.remove(self.part)
+
+def vectorize_loss(change_path: str, out_path: str, min_patch_pixels: int = 0, value: int = LOSS,
+                   simplify_px: float = SIMPLIFY_PX, tracer: Tracer | None = None) -> int:
+    """Write the loss patches of `change_path` to `out_path` (.geojson or .gpkg); returns
+    the number of polygons. Features are streamed, never collected in memory."""
+    ext = os.path.splitext(out_path)[1].lower()
+    if ext not in VECTOR_DRIVERS:
+        raise ValueError(f"Unsupported vector format {ext!r}; use one of {sorted(VECTOR_DRIVERS)}")
+    tracer = tracer or Tracer()
+    with tracer.span("vectorize") as sp, rasterio.open(change_path) as src:
+        sink = VectorWriter(out_path, src.crs)
+        n = 0
+        try:
+            for geom, props in loss_polygons(src, value, min_patch_pixels, simplify_px):
+                sink.write(geom, props); n += 1
+        except BaseException:
+            sink.abort()  # never publish a truncated layer
+            raise
+        sink.close()
+        sp.add(bytes_written=os.path.getsize(out_path))
+    print(f"🗺️ {n} loss patches → {out_path}")
+    return n
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import csv, hashlib, json, os
+from typing import Any, Iterator, List, Tuple
+import numpy as np, rasterio
+from rasterio.features import rasterize
+from rasterio.warp import transform_geom
+from rasterio.windows import transform as window_transform
+from .area import row_areas
+from .cog import COG_BLOCK, COG_COMPRESS
+from .instrument import Tracer
+from .tiling import iter_tiles, tile_shape_for
+from .utils import iter_features, transition_areas
+
+ZONE_FIELDS = ["zone_id", "total_area_ha", "forest_area_past_ha", "forest_area_present_ha",
+               "forest_loss_ha", "forest_gain_ha", "net_change_ha"]
+ZONES_CRS = "EPSG:4326"  # GeoJSON coordinates
+ZONE_TILE_PX = 2048
+ZONE_CACHE_DIR = os.path.join("outputs", "zones")
+
+def _points(coords) -> Iterator[List[float]]:
+    if isinstance(coords[0], (int, float)):
+        yield coords
+    else:
+        for part in coords:
+            yield from _points(part)
+
+def _stamp(path: str) -> List[Any]:
+    files = [os.path.join(path, f) for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+    return [[os.path.abspath(f), os.stat(f).st_mtime_ns, os.stat(f).st_size] for f in files]
+
+def zone_raster(zones: str, ref, cache_dir: str = ZONE_CACHE_DIR) -> Tuple[str, List[str]]:
+    """Zone-id raster of the polygon layer `zones` on `ref`'s grid, and the zone ids.
+
+    Pixel value i is zone ids[i - 1]; 0 is outside every polygon (where polygons
+    overlap the later one wins). Rasterized once per (layer, grid), tile by tile,
+    each tile only burning the polygons whose bounding box reaches it.
+    """
+    blob = json.dumps([_stamp(zones), ref.crs.to_string(), list(ref.transform), ref.width, ref.height])
+    key = hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+    path = os.path.join(cache_dir, f"zones_{key}.tif")
+    if os.path.exists(path):
+        with open(path[:-4] + ".json") as f:
+            return path, json.load(f)
+
+    ids, geoms = [], []
+    for fid, geom in iter_features(zones):
+        if geom:
+            ids.append(fid); geoms.append(transform_geom(ZONES_CRS, ref.crs, geom))
+    # pixel-space bounding boxes, for the per-tile candidate test
+    inv = ~ref.transform
+    boxes = np.empty((len(geoms), 4))
+    for i, geom in enumerate(geoms):
+        xs, ys = np.asarray(list(_points(geom["coordinates"])), dtype=float).T[:2]
+        cols, rows = inv * (np.array([xs.min(), xs.max()]), np.array([ys.min(), ys.max()]))
+        boxes[i] = cols.min(), rows.min(), cols.max(), rows.max()
+    dtype = "uint16" if len(ids) < np.iinfo(np.uint16).max else "uint32"
+    profile = dict(driver="GTiff", width=ref.width, height=ref.height, count=1, dtype=dtype, nodata=None,
+                   crs=ref.crs, transform=ref.transform, tiled=True, blockxsize=COG_BLOCK,
+                   blockysize=COG_BLOCK, compress=COG_COMPRESS, zlevel=1, bigtiff="IF_SAFER")
+    os.makedirs(cache_dir, exist_ok=True)
+    with rasterio.open(path + ".part", "w", **profile) as dst:
+        for win, _ in iter_tiles(ref.height, ref.width, tile_shape_for(dst, ZONE_TILE_PX)):
+            hit = np.flatnonzero((boxes[:, 0] < win.col_off + win.width) & (boxes[:, 2] >= win.col_off) &
+                                 (boxes[:, 1] < win.row_off + win.height) & (boxes[:, 3] >= win.row_off))
+            if hit.size:
+                tile = rasterize(((geoms[i], i + 1) for i in hit), out_shape=(win.height, win.width),
+                                 transform=window_transform(win, ref.transform), fill=0, dtype=dtype)
+                dst.write(tile, 1, window=win)
+    with open(path[:-4] + ".json", "w") as f:
+        json.dump(ids, f)
+    os.replace(path + ".part", path)
+    return path, ids
+
+def zonal_areas(zone_path: str, change_path: str, n_zones: int, row_area: np.ndarray) -> np.ndarray:
+    """(n_zones + 1, 4) area (m²) per zone and transition class, one bincount per tile."""
+    uniform = np.all(row_area == row_area[0])
+    areas = np.zeros((n_zones + 1) * 4)
+    with rasterio.open(zone_path) as zs, rasterio.open(change_path) as cs:
+        for win, _ in iter_tiles(zs.height, zs.width, tile_shape_for(zs, ZONE_TILE_PX)):
+            idx = zs.read(1, window=win).astype(np.intp) << 2
+            idx |= cs.read(1, window=win)
+            if uniform:
+                areas += np.bincount(idx.ravel(), minlength=areas.size) * row_area[0]
+            else:  # geographic grid: weight each pixel by its row's area
+                weights = np.repeat(row_area[win.row_off:win.row_off + win.height], win.width)
+                areas += np.bincount(idx.ravel(), weights=weights, minlength=areas.size)
+    return areas.reshape(-1, 4)
+
+def run_zonal(zones: str, change_path: str = os.path.join("outputs", "change_map.tif"),
+              out_dir: str = "outputs", cache_dir: str = ZONE_CACHE_DIR,
+              tracer: Tracer | None = None) -> str:
+    """Per-zone forest past/present, loss and gain hectares from a change map, written to
+    <out_dir>/zonal_summary.csv (one row per polygon of `zones`, a GeoJSON file or directory)."""
+    tracer = tracer or Tracer()
+    with rasterio.open(change_path) as ref:
+        row_area = row_areas(ref.crs, ref.transform, ref.height)
+        with tracer.span("zone_raster"):
+            zone_path, ids = zone_raster(zones, ref, cache_dir)
+    with tracer.span("zonal_areas", zones=len(ids)):
+        class_m2 = zonal_areas(zone_path, change_path, len(ids), row_area)
+    rows = []
+    for fid, m2 in zip(ids, class_m2[1:]):
+        areas = transition_areas(m2 / 10000.0)
+        rows.append({"zone_id": fid, "total_area_ha": round(float(m2.sum()) / 10000.0, 2),
+                     **{k: round(areas[k], 2) for k in ZONE_FIELDS[2:]}})
+    path = os.path.join(out_dir, "zonal_summary.csv")
+    with open(path + ".part", "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=ZONE_FIELDS)
+        w.writeheader(); w.writerows(rows)
+    os.replace(path + ".part", path)
+    print(f"📊 Zonal stats for {len(ids)} zones → {path}")
+    return path
@@ -0,0 +1,32 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class _Expr:
+    """Stands in for any server-side ee object: every attribute or call builds another one."""
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Expr()
+
+    def __call__(self, *args, **kwargs):
+        return _Expr()
+
+class _Geometry(_Expr):
+    def __init__(self, geojson):
+        self.geojson = geojson
+
+    def toGeoJSON(self):
+        return self.geojson
+
+class _FakeEE(_Expr):
+    Geometry = _Geometry
+    EEException = RuntimeError
+
+@pytest.fixture
+def fake_ee(monkeypatch):
+    """Stub out the `ee` module the GEE code builds its (never executed) graphs with."""
+    from src import gee_pipeline
+    monkeypatch.setattr(gee_pipeline, "ee", _FakeEE())
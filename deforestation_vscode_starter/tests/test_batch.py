@@ -0,0 +1,48 @@
+import csv, json
+
+from src import batch, gee_pipeline
+
+def _aoi(path, fids):
+    square = {"type": "Polygon", "coordinates": [[[80, 26], [80.1, 26], [80.1, 26.1], [80, 26.1], [80, 26]]]}
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {"id": fid}, "geometry": square} for fid in fids]}, f)
+    return str(path)
+
+class _Client:
+    def initialize(self):
+        pass
+
+def _fake_run(calls):
+    def run(aoi_path, t0, t1, ndvi_thresh, cloud_prob, region_name="AOI", **kwargs):
+        calls.append((region_name, ndvi_thresh))
+        return {"region": region_name, "past_window": list(t0), "present_window": list(t1),
+                "ndvi_threshold_used": ndvi_thresh, "export_error": None}
+    return run
+
+def _summary(out_dir):
+    with open(out_dir / "summary.csv") as f:
+        return [(r["region"], r["ndvi_threshold_used"]) for r in csv.DictReader(f)]
+
+def test_resume_skips_only_matching_runs(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(gee_pipeline, "run", _fake_run(calls))
+    out = tmp_path / "batch"
+    t0, t1 = ("2020-01-01", "2020-03-31"), ("2024-01-01", "2024-03-31")
+    run = lambda aoi, thresh: batch.run_batch(aoi, t0, t1, thresh, 20, out_dir=str(out), workers=1,
+                                              client=_Client())
+
+    aoi = _aoi(tmp_path / "aoi.geojson", ["a", "b"])
+    run(aoi, 0.5)
+    assert sorted(calls) == [("a", 0.5), ("b", 0.5)]
+    calls.clear(); run(aoi, 0.5)
+    assert calls == []  # same parameters: everything resumed
+
+    calls.clear(); run(aoi, 0.6)
+    assert sorted(calls) == [("a", 0.6), ("b", 0.6)]
+    assert _summary(out) == [("a", "0.6"), ("b", "0.6")]
+
+    # a feature dropped from the AOI file drops out of the summary too
+    calls.clear(); run(_aoi(tmp_path / "aoi.geojson", ["b"]), 0.6)
+    assert calls == []
+    assert _summary(out) == [("b", "0.6")]
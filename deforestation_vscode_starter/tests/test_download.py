@@ -0,0 +1,61 @@
+import os, threading, urllib.error
+
+import numpy as np, pytest, rasterio
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from src import gee_pipeline
+from src.download import download_mosaic
+
+TRANSFORM = from_origin(80.0, 26.06, 0.001, 0.001)
+
+class _FlakyTransport:
+    """Serves each sub-image from `image`, failing the first `failures` requests with `status`."""
+    def __init__(self, image, failures=1, status=503):
+        self.image, self.failures, self.status = image, failures, status
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise urllib.error.HTTPError(url, self.status, "Service Unavailable", {}, None)
+        col, row, w, h = map(int, url.split("/"))
+        with MemoryFile() as mem:
+            with mem.open(driver="GTiff", width=w, height=h, count=1, dtype="uint8", crs="EPSG:4326",
+                          transform=TRANSFORM) as ds:
+                ds.write(self.image[row:row + h, col:col + w], 1)
+            return mem.read()
+
+def _url_for(win, transform):
+    return f"{win.col_off}/{win.row_off}/{win.width}/{win.height}"
+
+def _retry(fn):
+    # what export_image uses
+    return gee_pipeline.with_retry(fn, retry_if=gee_pipeline._is_transient)
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(gee_pipeline.time, "sleep", delays.append)
+    return delays
+
+def test_transient_failure_is_retried(tmp_path, sleeps):
+    image = np.arange(60 * 50, dtype=np.uint8).reshape(60, 50)
+    transport = _FlakyTransport(image)
+    path = download_mosaic(_url_for, str(tmp_path / "mosaic.tif"), TRANSFORM, 50, 60, crs="EPSG:4326",
+                           tile_px=32, workers=1, transport=transport, retry=_retry)
+    assert transport.calls == 4 + 1  # four sub-images, one of them twice
+    assert len(sleeps) == 1 and sleeps[0] > 0
+    with rasterio.open(path) as ds:
+        assert np.array_equal(ds.read(1), image)
+
+def test_bad_request_is_not_retried(tmp_path, sleeps):
+    transport = _FlakyTransport(np.zeros((60, 50), dtype=np.uint8), failures=1, status=400)
+    path = str(tmp_path / "mosaic.tif")
+    with pytest.raises(urllib.error.HTTPError):
+        download_mosaic(_url_for, path, TRANSFORM, 50, 60, tile_px=32, workers=1,
+                        transport=transport, retry=_retry)
+    assert not sleeps
+    assert not os.path.exists(path) and not os.path.exists(path + ".part")
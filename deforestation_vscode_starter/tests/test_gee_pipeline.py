@@ -0,0 +1,68 @@
+import threading
+from collections import Counter
+
+import numpy as np, rasterio
+from affine import Affine
+
+from src import gee_pipeline
+from src.cache import ResultCache
+
+AOI = {"type": "Polygon", "coordinates": [[[80.9, 26.8], [81.0, 26.8], [81.0, 26.9], [80.9, 26.9], [80.9, 26.8]]]}
+META = {"count_filtered": 3, "count": 3, "bands": ["B4", "B8"], "source": "Sentinel-2"}
+INFO = {"past": META, "present": META,
+        "transitions": [{"class": 0, "sum": 5.0}, {"class": 2, "sum": 15.0}, {"class": 3, "sum": 80.0}]}
+
+class _FakeClient:
+    """Counts round-trips; download URLs point at local GeoTIFFs of the requested grid."""
+    def __init__(self, tile_dir):
+        self.tile_dir = tile_dir; self.calls = Counter(); self._lock = threading.Lock()
+
+    def initialize(self):
+        self.calls["initialize"] += 1
+
+    def get_info(self, obj):
+        self.calls["get_info"] += 1
+        return INFO
+
+    def download_url(self, image, params):
+        with self._lock:
+            self.calls["download_url"] += 1
+            n = self.calls["download_url"]
+        width, height = map(int, params["dimensions"].split("x"))
+        path = self.tile_dir / f"tile_{n}.tif"
+        with rasterio.open(path, "w", driver="GTiff", width=width, height=height, count=1, dtype="uint8",
+                           crs=params["crs"], transform=Affine(*params["crs_transform"])) as dst:
+            dst.write(np.full((1, height, width), 3, dtype="uint8"))
+        return path.as_uri()
+
+def test_run_is_one_get_info(tmp_path, monkeypatch, fake_ee):
+    monkeypatch.setattr(gee_pipeline, "EXPORT_TILE_PX", 256)  # the ~370 px AOI grid -> 2 x 2 tiles
+    client = _FakeClient(tmp_path)
+    cache = ResultCache(str(tmp_path / "cache"))
+    t0, t1 = ("2020-01-01", "2020-03-31"), ("2024-01-01", "2024-03-31")
+    run = lambda: gee_pipeline.run(None, t0, t1, 0.5, 20, client=client, cache=cache, geometry=AOI,
+                                   out_dir=str(tmp_path / "out"))
+
+    report = run()
+    assert client.calls == {"initialize": 1, "get_info": 1, "download_url": 4}
+    assert report["export_error"] is None
+    assert report["forest_area_past_ha"] == 95.0 and report["forest_loss_ha"] == 15.0
+    with rasterio.open(tmp_path / "out" / "forest_mask_present.tif") as ds:
+        assert ds.read(1).all()
+
+    run()  # stats and change map both come from the cache
+    assert client.calls == {"initialize": 1, "get_info": 1, "download_url": 4}
+
+def test_split_change_map_keeps_outside_aoi_as_nodata(tmp_path):
+    code = np.array([[0, 1, 2, 3], [255, 255, 3, 2]], dtype=np.uint8)  # 255: outside the AOI
+    with rasterio.open(tmp_path / "change_map.tif", "w", driver="GTiff", width=4, height=2, count=1,
+                       dtype="uint8", nodata=255, crs="EPSG:4326",
+                       transform=Affine(0.001, 0, 80, 0, -0.001, 27)) as dst:
+        dst.write(code, 1)
+    gee_pipeline.split_change_map(str(tmp_path))
+    outside = code == 255
+    for name, expect in (("forest_mask_past.tif", code >> 1), ("forest_mask_present.tif", code & 1)):
+        with rasterio.open(tmp_path / name) as ds:
+            mask = ds.read(1, masked=True)
+        assert np.array_equal(np.ma.getmaskarray(mask), outside), name
+        assert np.array_equal(mask.compressed(), expect[~outside]), name
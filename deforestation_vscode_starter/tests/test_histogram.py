@@ -0,0 +1,28 @@
+import numpy as np, pytest
+
+from src.histogram import NDVIHistogram
+
+filters = pytest.importorskip("skimage.filters")
+
+def _ndvi(seed, n=200_000):
+    # bare soil / sparse cover around 0.15, forest around 0.7, clipped to the NDVI range
+    rng = np.random.default_rng(seed)
+    k = int(n * rng.uniform(0.3, 0.7))
+    return np.clip(np.concatenate([rng.normal(0.15, 0.12, k), rng.normal(0.7, 0.08, n - k)]),
+                   -1, 1).astype(np.float32)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_otsu_matches_skimage(seed):
+    ndvi = _ndvi(seed)
+    hist = NDVIHistogram().update(ndvi)
+    assert abs(hist.otsu() - filters.threshold_otsu(ndvi)) <= hist.bin_width
+
+def test_merged_tiles_give_the_whole_raster_threshold():
+    ndvi = _ndvi(0).reshape(400, 500)
+    whole = NDVIHistogram().update(ndvi)
+    merged = NDVIHistogram()
+    for rows in np.array_split(ndvi, 7):
+        for tile in np.array_split(rows, 3, axis=1):
+            merged.merge(NDVIHistogram().update(tile))
+    assert np.array_equal(merged.counts, whole.counts)
+    assert merged.otsu() == whole.otsu()
@@ -0,0 +1,20 @@
+import time
+
+import numpy as np
+
+from src.instrument import Tracer
+
+def test_memory_is_per_span():
+    tracer = Tracer()
+    with tracer.span("big"):
+        a = np.ones(64 * 1024 * 1024, dtype=np.uint8)  # 64 MB, touched
+        time.sleep(0.05)
+        del a
+    with tracer.span("small"):
+        np.ones(1024, dtype=np.uint8).sum()
+    big, small = tracer.spans
+    if big.peak_rss_mb is None:  # no psutil and no /proc
+        return
+    assert big.rss_delta_mb >= 48
+    assert small.rss_delta_mb < 16  # not the process high-water mark left by "big"
+    assert small.peak_rss_mb < big.peak_rss_mb
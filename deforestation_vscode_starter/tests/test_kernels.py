@@ -0,0 +1,29 @@
+import numpy as np
+
+from src import kernels
+from src.kernels import EPS, fused_ndvi
+from src.histogram import NDVIHistogram
+
+def _reference(red, nir):
+    # the unfused formula, in float32
+    red = red.astype(np.float32); nir = nir.astype(np.float32)
+    return (nir - red) / np.maximum(nir + red, EPS)
+
+def test_fused_matches_unfused(monkeypatch):
+    monkeypatch.setattr(kernels, "CHUNK_PX", 1000)  # several chunks plus a ragged last one
+    rng = np.random.default_rng(0)
+    red = rng.integers(0, 10000, (97, 53)).astype("uint16"); nir = rng.integers(0, 10000, (97, 53)).astype("uint16")
+    red[0, :5] = 0; nir[0, :5] = 0  # zero denominators
+    ndvi = np.empty(red.shape, dtype="float32"); mask = np.empty(red.shape, dtype=bool)
+    hist = NDVIHistogram()
+    count = fused_ndvi(red, nir, 0.2, ndvi_out=ndvi, mask_out=mask, hist=hist)
+    ref = _reference(red, nir)
+    assert np.array_equal(ndvi, ref)
+    assert np.array_equal(mask, ref > np.float32(0.2)) and count == int((ref > np.float32(0.2)).sum())
+    assert hist.stats() == NDVIHistogram().update(ref).stats()
+
+def test_nan_input_stays_nan():
+    red = np.array([np.nan, 0.1], dtype="float32"); nir = np.array([0.5, 0.5], dtype="float32")
+    ndvi = np.empty(2, dtype="float32")
+    fused_ndvi(red, nir, ndvi_out=ndvi)
+    assert np.isnan(ndvi[0]) and np.isclose(ndvi[1], 0.4 / 0.6)
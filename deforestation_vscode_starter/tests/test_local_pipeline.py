@@ -0,0 +1,44 @@
+import numpy as np, pytest, rasterio
+
+from benchmarks.synth import synth_pair
+from src import local_pipeline
+from src.local_pipeline import OUTPUT_MASKS, LOSS_PATCHES
+
+SIZE = 300  # two 256 px blocks per side, so 128 px tiles cut through blocks too
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    d = str(tmp_path_factory.mktemp("inputs"))
+    return (*synth_pair(d, SIZE, period=0), *synth_pair(d, SIZE, period=1))
+
+def _run(inputs, thresh, **kwargs):
+    report = local_pipeline.run(*inputs, thresh, 25, 1, **kwargs)
+    report.pop("instrumentation")
+    with open(f"outputs/{LOSS_PATCHES}") as f:
+        patches = f.read()
+    rasters = {}
+    for name in OUTPUT_MASKS:
+        with rasterio.open(f"outputs/{name}") as ds:
+            rasters[name] = ds.read(1)
+    return report, patches, rasters
+
+@pytest.mark.parametrize("thresh", [0.3, None])  # fixed and Otsu
+def test_tiled_matches_in_memory(inputs, thresh, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    base = _run(inputs, thresh)
+    assert base[0]["forest_loss_ha"] > 0 and base[0]["loss_patches"] > 0
+    for workers in (1, 2):
+        report, patches, rasters = _run(inputs, thresh, tile_size=128, workers=workers)
+        assert report == base[0]  # areas, percentages, NDVI stats: exactly equal
+        assert patches == base[1]
+        for name in OUTPUT_MASKS:
+            assert np.array_equal(rasters[name], base[2][name]), name
+
+def test_tiled_reports_per_stage_seconds(inputs, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    report = local_pipeline.run(*inputs, None, 25, 1, tile_size=128)
+    spans = {s["name"]: s for s in report["instrumentation"]["stages"]}
+    assert set(spans["otsu_pass"]["attrs"]["stage_s"]) == {"read", "ndvi", "threshold"}
+    # Otsu thresholds are known by the mask pass, so it applies them in the fused NDVI kernel
+    assert set(spans["tiles"]["attrs"]["stage_s"]) == {"read", "ndvi", "closing", "small_objects",
+                                                       "patch_stats", "write"}
@@ -0,0 +1,55 @@
+import numpy as np, rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from src.mmapio import MappedReader, mmap_band
+
+PROFILE = dict(driver="GTiff", width=256, height=256, count=1, dtype="float32", tiled=True,
+               blockxsize=64, blockysize=64, crs="EPSG:32644", transform=from_origin(500000, 3000000, 10, 10))
+
+def _band():
+    return np.arange(256 * 256, dtype="float32").reshape(256, 256)
+
+def test_in_order_tiles_are_mapped(tmp_path):
+    path, a = str(tmp_path / "a.tif"), _band()
+    with rasterio.open(path, "w", **PROFILE) as ds:
+        ds.write(a, 1)
+    with rasterio.open(path) as ds:
+        assert mmap_band(ds) is not None
+        assert np.array_equal(MappedReader(ds).read(1, window=Window(30, 50, 100, 90)), a[50:140, 30:130])
+
+def test_shuffled_middle_blocks_fall_back(tmp_path):
+    # first and last block where a contiguous file has them, the rest written in reverse
+    path, a = str(tmp_path / "a.tif"), _band()
+    blocks = [(r, c) for r in range(4) for c in range(4)]
+    with rasterio.open(path, "w", **PROFILE) as ds:
+        for r, c in blocks[:1] + blocks[1:-1][::-1] + blocks[-1:]:
+            ds.write(a[r * 64:(r + 1) * 64, c * 64:(c + 1) * 64], 1, window=Window(c * 64, r * 64, 64, 64))
+    with rasterio.open(path) as ds:
+        assert mmap_band(ds) is None
+        assert np.array_equal(MappedReader(ds).read(1), a)
+
+def test_packed_nbits_falls_back(tmp_path):
+    path = str(tmp_path / "a.tif")
+    a = (_band() % 4096).astype("uint16")
+    # one strip per band: block offsets alone look like a contiguous file
+    profile = dict(PROFILE, count=2, dtype="uint16", nbits=12, interleave="band", tiled=False, blockysize=256)
+    del profile["blockxsize"]
+    with rasterio.open(path, "w", **profile) as ds:
+        ds.write(np.stack([a, a[::-1]]))
+    with rasterio.open(path) as ds:
+        assert mmap_band(ds, 1) is None and mmap_band(ds, 2) is None
+        reader = MappedReader(ds)
+        assert np.array_equal(reader.read(1), a) and np.array_equal(reader.read(2), a[::-1])
+        assert np.array_equal(reader.read(2, window=Window(10, 20, 30, 40)), a[::-1][20:60, 10:40])
+
+def test_striped_with_short_last_strip_is_mapped(tmp_path):
+    path = str(tmp_path / "a.tif")
+    a = _band()[:250]
+    profile = dict(PROFILE, height=250, tiled=False, blockysize=16)
+    del profile["blockxsize"]
+    with rasterio.open(path, "w", **profile) as ds:
+        ds.write(a, 1)
+    with rasterio.open(path) as ds:
+        assert mmap_band(ds) is not None
+        assert np.array_equal(MappedReader(ds).read(1), a)
@@ -0,0 +1,39 @@
+import pytest
+
+from src import monitor
+
+META = {"count_filtered": 3, "count": 3, "bands": ["B4", "B8"], "source": "Sentinel-2"}
+
+class _Client:
+    def initialize(self):
+        pass
+
+    def get_info(self, obj):
+        return {"meta": META, "forest_ha": 90.0,
+                "transitions": [{"class": 3, "sum": 85.0}, {"class": 2, "sum": 5.0}]}
+
+@pytest.mark.parametrize("period, window", [
+    ("2024", ("2024-01-01", "2025-01-01")),
+    ("2024-03", ("2024-03-01", "2024-04-01")),
+    ("2024-12", ("2024-12-01", "2025-01-01")),
+    ("2024-01-15/2024-02-15", ("2024-01-15", "2024-02-15")),
+])
+def test_period_window(period, window):
+    assert monitor.period_window(period) == window
+
+@pytest.mark.parametrize("period", ["March", "2024-13", "2024-03-01/2024-02-01"])
+def test_bad_period(period):
+    with pytest.raises(ValueError):
+        monitor.period_window(period)
+
+def test_gee_period_must_follow_the_last(tmp_path, fake_ee):
+    store = monitor.MonitorStore(str(tmp_path), "aoi")
+    step = lambda period, window: monitor.step_gee(store, period, window, {"type": "Point", "coordinates": [80, 26]},
+                                                   0.4, 40, client=_Client())
+    step("2019-01-01", ("2019-01-01", "2019-03-31"))
+    rec = step("2024-03", monitor.period_window("2024-03"))
+    assert rec["start"] == "2024-03-01" and rec["forest_loss_ha"] == 5.0
+    step("2024-04", monitor.period_window("2024-04"))  # starts where March ends
+    with pytest.raises(ValueError):
+        step("2024-02", monitor.period_window("2024-02"))
+    assert [p["period"] for p in store.periods] == ["2019-01-01", "2024-03", "2024-04"]
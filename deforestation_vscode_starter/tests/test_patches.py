@@ -0,0 +1,68 @@
+import inspect, warnings
+
+import numpy as np, pytest
+from rasterio.windows import Window
+
+from src.patches import PatchIndex, close_disk, label_tile, remove_small_patches
+from src.tiling import iter_tiles
+
+morphology = pytest.importorskip("skimage.morphology")
+
+def _masks():
+    rng = np.random.default_rng(1)
+    for shape, p in (((60, 80), 0.5), ((73, 41), 0.3), ((50, 50), 0.7)):
+        yield rng.random(shape) < p
+
+def _remove_small_objects(mask, n):
+    if "max_size" in inspect.signature(morphology.remove_small_objects).parameters:
+        return morphology.remove_small_objects(mask, max_size=n - 1, connectivity=1)
+    return morphology.remove_small_objects(mask, min_size=n, connectivity=1)
+
+def _binary_closing(mask, footprint):
+    with warnings.catch_warnings():  # deprecated in skimage 0.26, still the reference
+        warnings.simplefilter("ignore", FutureWarning)
+        return morphology.binary_closing(mask, footprint)
+
+@pytest.mark.parametrize("r", [1, 2, 3])
+def test_close_disk_matches_skimage(r):
+    for mask in _masks():
+        assert np.array_equal(close_disk(mask, r), _binary_closing(mask, morphology.disk(r)))
+
+@pytest.mark.parametrize("n", [2, 5, 25])
+def test_remove_small_patches_matches_skimage(n):
+    for mask in _masks():
+        assert np.array_equal(remove_small_patches(mask, n), _remove_small_objects(mask, n))
+
+def _strip_ids(patches):
+    # merged ids depend on the tiling; areas are summed in another order
+    return [{**{k: v for k, v in p.items() if k != "id"}, "area_m2": pytest.approx(p["area_m2"])}
+            for p in patches]
+
+def _crosses_seam(p, tile_shape):
+    th, tw = tile_shape
+    return p["row_min"] // th != (p["row_max"] - 1) // th or p["col_min"] // tw != (p["col_max"] - 1) // tw
+
+@pytest.mark.parametrize("tile_shape", [(16, 16), (7, 30), (60, 13)])
+def test_patch_index_across_seams(tile_shape):
+    rng = np.random.default_rng(2)
+    mask = rng.random((60, 80)) < 0.55  # near percolation: patches span many tiles
+    row_area = np.linspace(90.0, 110.0, mask.shape[0])  # per-row areas, as on a lon/lat grid
+    whole = PatchIndex(); whole.add(mask, row_area=row_area)
+    expected = _strip_ids(whole.patches(3))
+    assert any(_crosses_seam(p, tile_shape) for p in whole.patches(3))
+
+    tiles = [inner for inner, _ in iter_tiles(*mask.shape, tile_shape)]
+    tiled, merged = PatchIndex(), PatchIndex()
+    for win in tiles[::-1]:  # order must not matter
+        sl = win.toslices()
+        tiled.add(mask[sl], win, row_area)
+        merged.merge(label_tile(mask[sl], win, row_area[sl[0]])[1])
+    assert _strip_ids(tiled.patches(3)) == expected
+    assert _strip_ids(merged.patches(3)) == expected
+
+def test_patch_index_window_offsets():
+    mask = np.zeros((4, 6), dtype=bool); mask[1:3, 2:5] = True
+    index = PatchIndex(); index.add(mask, Window(10, 20, 6, 4))
+    (p,) = index.patches()
+    assert (p["row_min"], p["col_min"], p["row_max"], p["col_max"]) == (21, 12, 23, 15)
+    assert p["pixels"] == 6 and p["area_m2"] == 6.0
@@ -0,0 +1,25 @@
+import urllib.request
+
+import numpy as np, rasterio
+from rasterio.transform import from_bounds
+
+from src.tileserver import TileServer
+
+def test_tiles_reuse_the_dataset_handle(tmp_path, monkeypatch):
+    path = str(tmp_path / "mask.tif")
+    with rasterio.open(path, "w", driver="GTiff", width=64, height=64, count=1, dtype="uint8",
+                       crs="EPSG:4326", transform=from_bounds(0, 0, 10, 10, 64, 64)) as dst:
+        dst.write(np.arange(64 * 64, dtype=np.uint8).reshape(64, 64), 1)
+    server = TileServer(port=0, public_url=None, render_threads=1)
+    try:
+        url = server.register(path, palette=["red", "green"], vmin=0, vmax=255)
+        opens = []
+        real_open = rasterio.open
+        monkeypatch.setattr(rasterio, "open", lambda *a, **kw: opens.append(a) or real_open(*a, **kw))
+        # separate connections, so separate request threads on the HTTP server
+        for z, x, y in ((0, 0, 0), (1, 1, 0)):
+            with urllib.request.urlopen(url.format(z=z, x=x, y=y), timeout=10) as resp:
+                assert resp.status == 200 and resp.read().startswith(b"\x89PNG")
+        assert len(opens) == 1
+    finally:
+        server.close()
@@ -0,0 +1,39 @@
+import os
+
+import fiona, numpy as np, pytest, rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import shape
+
+from src import vectorize
+from src.local_pipeline import LOSS
+
+def _change_map(path):
+    code = np.zeros((64, 64), dtype="uint8")
+    code[4:40, 4:40] = LOSS
+    code[6:37, 6:37] = 0           # ring one or two pixels wide around a large hole
+    code[50:60, 10:12] = LOSS      # a thin bar
+    with rasterio.open(path, "w", driver="GTiff", width=64, height=64, count=1, dtype="uint8",
+                       crs="EPSG:32644", transform=from_origin(500000, 3000000, 10, 10)) as dst:
+        dst.write(code, 1)
+    return str(path)
+
+@pytest.mark.parametrize("ext", [".gpkg", ".geojson"])
+def test_polygons_are_valid(tmp_path, ext):
+    out = str(tmp_path / f"loss{ext}")
+    assert vectorize.vectorize_loss(_change_map(tmp_path / "change.tif"), out, simplify_px=2.0) == 2
+    with fiona.open(out) as src:
+        feats = list(src)
+    assert sorted(f["properties"]["pixels"] for f in feats) == [20, 36 * 36 - 31 * 31]
+    assert all(shape(f["geometry"]).is_valid for f in feats)
+    assert any(len(shape(f["geometry"]).interiors) == 1 for f in feats)
+
+def test_failed_run_publishes_nothing(tmp_path, monkeypatch):
+    def broken(*args, **kwargs):
+        yield {"type": "Polygon", "coordinates": [[(0, 0), (1, 0), (1, 1), (0, 0)]]}, \
+            {"patch_id": 1, "pixels": 1, "area_ha": 0.01}
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(vectorize, "loss_polygons", broken)
+    out = str(tmp_path / "loss.gpkg")
+    with pytest.raises(RuntimeError):
+        vectorize.vectorize_loss(_change_map(tmp_path / "change.tif"), out)
+    assert not os.path.exists(out) and not os.path.exists(out + ".part")